@@ -1,6 +1,8 @@
 import os
+import time
 
 from celery import Celery
+from celery.signals import before_task_publish, task_postrun, task_prerun
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'altvote.settings')
 
@@ -9,3 +11,33 @@ app = Celery('proj')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.autodiscover_tasks()
+
+# routes tasks and connects the hooks for coalesced tasks
+import altvote.queues  # noqa: E402,F401
+
+_task_started = {}
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    headers['sent_at'] = time.time()
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    from altvote import metrics
+
+    _task_started[task_id] = time.perf_counter()
+    sent_at = task.request.get('sent_at')
+    if sent_at is not None:
+        metrics.TASK_QUEUE_WAIT.observe(max(time.time() - sent_at, 0.0), task=task.name)
+
+
+@task_postrun.connect
+def record_task_runtime(task_id=None, task=None, state=None, **kwargs):
+    from altvote import metrics
+
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.TASK_RUNTIME.observe(time.perf_counter() - started, task=task.name, state=state)
+    metrics.maybe_flush()
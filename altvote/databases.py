@@ -0,0 +1,76 @@
+"""
+Database profiles selected with the DB_PROFILE environment variable.
+
+sqlite    WAL journal, synchronous=NORMAL, busy timeout and mmap applied on
+          every new connection; writers take the lock up front (IMMEDIATE)
+          so concurrent vote writers wait instead of failing on lock upgrade.
+postgres  psycopg 3 connection pool (Django's native pooling). Pooling and
+          CONN_MAX_AGE are mutually exclusive in Django, so setting
+          POSTGRES_POOL=0 switches to persistent connections instead.
+
+Read replicas are added as `replica_1`, `replica_2`, ... aliases from
+POSTGRES_REPLICA_HOSTS or SQLITE_REPLICA_NAMES (comma-separated) and are
+used by altvote.db_routers.PrimaryReplicaRouter. They mirror `default` in
+tests.
+"""
+import os
+
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+)
+
+
+def sqlite_database(base_dir):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('SQLITE_NAME', default=base_dir / 'db.sqlite3'),
+        'OPTIONS': {
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def postgres_database():
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv('POSTGRES_DB', default='altvote'),
+        'USER': os.getenv('POSTGRES_USER', default='altvote'),
+        'PASSWORD': os.getenv('POSTGRES_PASSWORD', default=''),
+        'HOST': os.getenv('POSTGRES_HOST', default='127.0.0.1'),
+        'PORT': os.getenv('POSTGRES_PORT', default='5432'),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if os.getenv('POSTGRES_POOL', default='1') == '1':
+        database['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('POSTGRES_POOL_MIN_SIZE', default=2)),
+            'max_size': int(os.getenv('POSTGRES_POOL_MAX_SIZE', default=10)),
+            'timeout': int(os.getenv('POSTGRES_POOL_TIMEOUT', default=10)),
+        }
+    else:
+        database['CONN_MAX_AGE'] = int(os.getenv('POSTGRES_CONN_MAX_AGE', default=60))
+    return database
+
+
+def replica_databases(primary, setting, env_var):
+    replicas = {}
+    for number, value in enumerate(filter(None, os.getenv(env_var, default='').split(',')), start=1):
+        replica = {**primary, setting: value.strip(), 'TEST': {'MIRROR': 'default'}}
+        replicas[f'replica_{number}'] = replica
+    return replicas
+
+
+def get_databases(base_dir):
+    profile = os.getenv('DB_PROFILE', default='sqlite')
+    if profile == 'postgres':
+        primary = postgres_database()
+        return {'default': primary, **replica_databases(primary, 'HOST', 'POSTGRES_REPLICA_HOSTS')}
+    if profile == 'sqlite':
+        primary = sqlite_database(base_dir)
+        return {'default': primary, **replica_databases(primary, 'NAME', 'SQLITE_REPLICA_NAMES')}
+    raise ValueError(f'Unknown DB_PROFILE {profile!r}, expected "sqlite" or "postgres".')
@@ -0,0 +1,86 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.functional import LazyObject, empty
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# set by altvote.middleware.ReplicaRoutingMiddleware for the duration of a request
+current_request = ContextVar('current_request', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+def sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def mark_sticky(user_id):
+    """Pins the user's reads to the primary until replicas have caught up with their write."""
+    cache.set(sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+def resolved_user(request):
+    """
+    Returns request.user only if it has already been resolved.
+
+    Resolving a lazy session user here would read the session through this
+    router and recurse; JWT users are set eagerly by DRF after authentication.
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, LazyObject):
+        user = user._wrapped
+        if user is empty:
+            return None
+    return user
+
+
+class PrimaryReplicaRouter:
+    """
+    Routes reads of safe-method requests to a replica and everything else to the primary.
+
+    Reads outside requests (Celery tasks, commands), inside transactions, of
+    unsafe requests, and of users who wrote within REPLICA_STICKY_SECONDS go to
+    the primary. A request keeps the same replica for all of its reads.
+    """
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas:
+            return None
+
+        request = current_request.get()
+        if request is None or request.method not in SAFE_METHODS:
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'
+
+        user = resolved_user(request)
+        user_id = user.pk if user is not None and user.is_authenticated else None
+        cached = getattr(request, '_db_for_read', None)
+        if cached is not None and cached[0] == user_id:
+            return cached[1]
+
+        if user_id is not None and cache.get(sticky_key(user_id)):
+            alias = 'default'
+        else:
+            alias = random.choice(self.replicas)
+        request._db_for_read = (user_id, alias)
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,151 @@
+"""
+Lightweight Prometheus-style histograms shared between web and Celery workers.
+
+Observations are aggregated in process memory and periodically merged into a
+single Redis hash with HINCRBYFLOAT, so every gunicorn and Celery process
+contributes to the same series and a scrape of any web worker sees all of them.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+METRICS_KEY = 'altvote:metrics'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+TASK_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0)
+
+_lock = threading.Lock()
+_pending = defaultdict(float)
+_last_flush = time.monotonic()
+_histograms = {}
+_gauges = {}
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        _histograms[name] = self
+
+    def observe(self, value, **labels):
+        label_str = ','.join(f'{key}="{val}"' for key, val in sorted(labels.items()))
+        # the first bucket the value fits in; cumulative counts are built at render time
+        le = next((bound for bound in self.buckets if value <= bound), math.inf)
+        with _lock:
+            _pending[(self.name, label_str, format_bound(le))] += 1
+            _pending[(self.name, label_str, 'sum')] += value
+            _pending[(self.name, label_str, 'count')] += 1
+
+
+def register_gauge(name, documentation, collect):
+    """Registers a gauge computed at scrape time; `collect` returns {labels: value}."""
+    _gauges[name] = (documentation, collect)
+
+
+def format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def format_value(value):
+    # shortest exact form; counters must not be rounded to a few significant digits
+    return repr(float(value))
+
+
+def get_connection():
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def maybe_flush():
+    """Flushes if the interval has passed; with Redis unavailable the observations stay buffered."""
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        try:
+            flush()
+        except RedisError:
+            pass
+
+
+def flush():
+    """Moves the observations buffered by this process into Redis."""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, defaultdict(float)
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        pipeline = get_connection().pipeline(transaction=False)
+        for (name, label_str, field), value in pending.items():
+            pipeline.hincrbyfloat(METRICS_KEY, f'{name}|{label_str}|{field}', value)
+        pipeline.execute()
+    except RedisError:
+        # put them back for the next flush, merged with whatever was observed meanwhile
+        with _lock:
+            for key, value in pending.items():
+                _pending[key] += value
+        raise
+
+
+def render(shared=True):
+    """
+    Renders all series in the Prometheus text exposition format.
+
+    With `shared` off, Redis is not touched and only the observations this
+    process has not flushed yet are rendered.
+    """
+    if shared:
+        flush()
+        shared_values = get_connection().hgetall(METRICS_KEY)
+        values = [(*key.decode().split('|'), float(value)) for key, value in shared_values.items()]
+    else:
+        with _lock:
+            values = [(*key, value) for key, value in _pending.items()]
+    series = defaultdict(lambda: defaultdict(dict))
+    for name, label_str, field, value in values:
+        series[name][label_str][field] = value
+
+    lines = []
+    for name, histogram in _histograms.items():
+        lines.append(f'# HELP {name} {histogram.documentation}')
+        lines.append(f'# TYPE {name} histogram')
+        bounds = [format_bound(bound) for bound in histogram.buckets] + ['+Inf']
+        for label_str, fields in sorted(series[name].items()):
+            prefix = f'{label_str},' if label_str else ''
+            cumulative = 0.0
+            for bound in bounds:
+                cumulative += fields.get(bound, 0.0)
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {format_value(cumulative)}')
+            lines.append(f'{name}_sum{{{label_str}}} {format_value(fields.get("sum", 0.0))}')
+            lines.append(f'{name}_count{{{label_str}}} {format_value(fields.get("count", 0.0))}')
+
+    for name, (documentation, collect) in _gauges.items():
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} gauge')
+        for label_str, value in sorted(collect().items()):
+            lines.append(f'{name}{{{label_str}}} {format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_LATENCY = Histogram(
+    'altvote_http_request_duration_seconds', 'Total request latency by view.', LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'altvote_http_request_sql_queries', 'SQL queries issued per request by view.', QUERY_COUNT_BUCKETS
+)
+REQUEST_SQL_TIME = Histogram(
+    'altvote_http_request_sql_duration_seconds', 'Time spent in SQL per request by view.', LATENCY_BUCKETS
+)
+TASK_RUNTIME = Histogram(
+    'altvote_celery_task_duration_seconds', 'Celery task runtime by task and state.', TASK_BUCKETS
+)
+TASK_QUEUE_WAIT = Histogram(
+    'altvote_celery_task_queue_wait_seconds', 'Time between publishing and starting a task.', TASK_BUCKETS
+)
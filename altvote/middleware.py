@@ -0,0 +1,125 @@
+import cProfile
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from altvote import db_routers, metrics, profiling
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryLog(QueryCounter):
+    """QueryCounter that also keeps the SQL text (without parameters) of each query."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.duration += duration
+            self.count += 1
+            self.queries.append({'sql': sql, 'many': many, 'duration': duration})
+
+
+class MetricsMiddleware:
+    """Records per-view latency, SQL query count and SQL time histograms."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        labels = {'method': request.method, 'view': match.view_name if match else 'unresolved'}
+        metrics.REQUEST_LATENCY.observe(duration, **labels)
+        metrics.REQUEST_QUERIES.observe(counter.count, **labels)
+        metrics.REQUEST_SQL_TIME.observe(counter.duration, **labels)
+        metrics.maybe_flush()
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Runs opted-in requests under cProfile and stores the profile with its SQL log.
+
+    Must come after AuthenticationMiddleware. Requests without the profiling
+    header or query flag only pay for two dictionary lookups.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+
+        query_log = QueryLog()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        response['X-Profile-Id'] = profiling.save_profile(
+            request, response, profiler, query_log.queries, duration
+        )
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Exposes the current request to PrimaryReplicaRouter and makes writers sticky.
+
+    After a successful unsafe request by an authenticated user, that user's
+    reads are pinned to the primary for REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.has_replicas = bool(db_routers.replica_aliases())
+
+    def __call__(self, request):
+        token = db_routers.current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_routers.current_request.reset(token)
+
+        if self.has_replicas and request.method not in db_routers.SAFE_METHODS and response.status_code < 400:
+            user = db_routers.resolved_user(request)
+            if user is not None and user.is_authenticated:
+                db_routers.mark_sticky(user.pk)
+        return response
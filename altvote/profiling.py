@@ -0,0 +1,96 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries an `X-Profile` header with a token from
+`make_token()` (`python manage.py profiling_token`), or when a staff user with
+a session adds `?profile=1`. Each profile is stored in PROFILING_DIR as a
+cProfile dump (`<id>.prof`, readable with pstats or snakeviz) and a JSON file
+(`<id>.json`) holding request metadata and the SQL log. Only the newest
+PROFILING_MAX_PROFILES profiles are kept.
+"""
+import json
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+SALT = 'altvote.profiling'
+TOKEN_VALUE = 'profile'
+HEADER = 'HTTP_X_PROFILE'
+QUERY_FLAG = 'profile='
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign(TOKEN_VALUE)
+
+
+def is_valid_token(token):
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def should_profile(request):
+    token = request.META.get(HEADER)
+    if token is not None:
+        return is_valid_token(token)
+    if QUERY_FLAG in request.META.get('QUERY_STRING', ''):
+        return request.GET.get('profile') == '1' and request.user.is_staff
+    return False
+
+
+def save_profile(request, response, profiler, queries, duration):
+    """Stores the profile and its SQL log, then drops the oldest profiles."""
+    directory = Path(settings.PROFILING_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    created_at = timezone.now()
+    profile_id = f'{created_at:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+    profiler.dump_stats(directory / f'{profile_id}.prof')
+
+    metadata = {
+        'id': profile_id,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'created_at': created_at.isoformat(),
+        'duration': duration,
+        'queries_count': len(queries),
+        'queries_duration': sum(query['duration'] for query in queries),
+        'queries': queries,
+    }
+    (directory / f'{profile_id}.json').write_text(json.dumps(metadata))
+
+    rotate(directory)
+    return profile_id
+
+
+def rotate(directory):
+    metadata_files = sorted(directory.glob('*.json'), reverse=True)
+    for metadata_file in metadata_files[settings.PROFILING_MAX_PROFILES:]:
+        metadata_file.unlink(missing_ok=True)
+        metadata_file.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def list_profiles(limit=50):
+    """Returns metadata of the most recent profiles, newest first, without SQL logs."""
+    directory = Path(settings.PROFILING_DIR)
+    if not directory.exists():
+        return []
+
+    profiles = []
+    for metadata_file in sorted(directory.glob('*.json'), reverse=True)[:limit]:
+        try:
+            metadata = json.loads(metadata_file.read_text())
+        except (OSError, ValueError):
+            # rotated away or still being written by another worker
+            continue
+        metadata.pop('queries', None)
+        profiles.append(metadata)
+    return profiles
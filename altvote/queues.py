@@ -0,0 +1,130 @@
+"""
+Celery queue layout, worker profiles and publish-side backpressure.
+
+Tasks are routed by class so slow work never sits in front of counter
+updates:
+
+    counters   vote trending events and comment counter updates, sub-millisecond
+    reactions  comment like/dislike toggles
+    heavy      search indexing and anything else slow
+
+Start one worker per queue with its profile from WORKER_PROFILES:
+
+    python manage.py run_worker counters
+
+`enqueue` checks the depth of the task's queue before publishing. Past
+QUEUE_BACKPRESSURE_DEPTH, counter and reaction tasks run inline in the
+caller, and heavy tasks (which are idempotent) are coalesced so at most one
+copy per arguments waits in the queue.
+"""
+import hashlib
+import json
+import time
+
+from celery.signals import task_prerun
+from django.conf import settings
+from django.core.cache import cache
+
+from altvote import metrics
+
+COUNTERS = 'counters'
+REACTIONS = 'reactions'
+HEAVY = 'heavy'
+QUEUES = (COUNTERS, REACTIONS, HEAVY)
+
+TASK_QUEUES = {
+    'polls.tasks.on_vote': COUNTERS,
+    'polls.tasks.on_tallies_changed': COUNTERS,
+    'polls.tasks.on_comment': COUNTERS,
+    'polls.tasks.on_like': REACTIONS,
+    'polls.tasks.on_dislike': REACTIONS,
+    'polls.tasks.on_poll_saved': HEAVY,
+    'polls.tasks.on_polls_saved': HEAVY,
+    'polls.tasks.on_poll_deleted': HEAVY,
+    'polls.tasks.on_voters_rebuild': HEAVY,
+    'polls.tasks.snapshot_tallies': HEAVY,
+    'polls.tasks.prune_tally_snapshots': HEAVY,
+}
+
+# many cheap tasks per process for the fast queues, one at a time for heavy work (whose tasks ack late)
+WORKER_PROFILES = {
+    COUNTERS: {'concurrency': 8, 'prefetch_multiplier': 16},
+    REACTIONS: {'concurrency': 4, 'prefetch_multiplier': 8},
+    HEAVY: {'concurrency': 2, 'prefetch_multiplier': 1},
+}
+
+INLINE = 'inline'
+COALESCE = 'coalesce'
+OVERLOAD_POLICIES = {COUNTERS: INLINE, REACTIONS: INLINE, HEAVY: COALESCE}
+
+# queue depths are sampled at most once per interval per process
+DEPTH_CHECK_INTERVAL = 1.0
+_depths = {}
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """CELERY_TASK_ROUTES entry: every polls.tasks task goes to its class queue, unknown ones to heavy."""
+    if name in TASK_QUEUES:
+        return {'queue': TASK_QUEUES[name]}
+    if name.startswith('polls.tasks.'):
+        return {'queue': HEAVY}
+    return None
+
+
+def queue_for(task):
+    return (route_task(task.name, (), {}, {}) or {}).get('queue', task.app.conf.task_default_queue)
+
+
+def fetch_depth(queue):
+    from altvote.celery import app
+
+    try:
+        with app.connection_for_read() as connection:
+            return connection.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception:
+        # a queue that was never declared is empty; an unreachable broker is reported by publishing
+        return 0
+
+
+def queue_depth(queue):
+    checked_at, depth = _depths.get(queue, (0.0, 0))
+    if time.monotonic() - checked_at >= DEPTH_CHECK_INTERVAL:
+        depth = fetch_depth(queue)
+        _depths[queue] = (time.monotonic(), depth)
+    return depth
+
+
+def coalesce_key(task_name, kwargs):
+    digest = hashlib.sha1(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+    return f'tasks:pending:{task_name}:{digest}'
+
+
+def enqueue(task, **kwargs):
+    """Publishes `task` with `kwargs`, or degrades per OVERLOAD_POLICIES when its queue is backed up."""
+    if task.app.conf.task_always_eager:
+        return task.delay(**kwargs)
+
+    queue = queue_for(task)
+    if queue_depth(queue) < settings.QUEUE_BACKPRESSURE_DEPTH:
+        return task.delay(**kwargs)
+
+    if OVERLOAD_POLICIES.get(queue) == INLINE:
+        return task.apply(kwargs=kwargs)
+
+    # the marker is dropped when a worker picks the task up, see clear_coalesce_marker
+    if cache.add(coalesce_key(task.name, kwargs), 1, settings.QUEUE_COALESCE_TIMEOUT):
+        return task.apply_async(kwargs=kwargs, headers={'coalesced': True})
+    return None
+
+
+def collect_depths():
+    return {f'queue="{queue}"': fetch_depth(queue) for queue in QUEUES}
+
+
+metrics.register_gauge('altvote_celery_queue_depth', 'Messages waiting in each Celery queue.', collect_depths)
+
+
+@task_prerun.connect
+def clear_coalesce_marker(task=None, kwargs=None, **kw):
+    if task.request.get('coalesced'):
+        cache.delete(coalesce_key(task.name, kwargs or {}))
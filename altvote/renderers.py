@@ -0,0 +1,63 @@
+import decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the stdlib encoder escapes these two separators, orjson writes them raw
+LINE_SEPARATOR = '\u2028'.encode()
+PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson, producing the same bytes as DRF's JSONRenderer.
+
+    Types orjson can't handle natively, or would format differently (datetimes,
+    lazy strings), are passed to DRF's JSONEncoder. Decimals, indented output,
+    ASCII-only output and a missing orjson fall back to the stdlib renderer.
+
+    orjson formats floats differently (1e16 for 1e+16, null for NaN), so views
+    whose payloads hold floats use `float_safe_renderers()` instead.
+    """
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    def __init__(self):
+        self.encoder_default = JSONEncoder().default
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            # DRF's encoder turns it into a float, which orjson would format differently
+            raise TypeError
+        return self.encoder_default(obj)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. Decimals or integers wider than 64 bits, which the stdlib encoder accepts
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+
+
+def float_safe_renderers():
+    """The default renderers with DRF's JSONRenderer in place of ORJSONRenderer."""
+    return [
+        JSONRenderer if renderer is ORJSONRenderer else renderer for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+    ]
@@ -4,6 +4,8 @@ from datetime import timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 
+from altvote.databases import get_databases
+
 load_dotenv('.env')
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -26,12 +28,19 @@ RUN_TYPE = os.getenv('RUN_TYPE', default='LOCAL')
 
 SITE_ID = 1
 
+# PRODUCTION PROFILE
+# set to 0 in API processes to leave the admin and the live schema/docs views (and their apps) unloaded;
+# api/schema/ then serves the file built by `manage.py build_schema`
+ENABLE_ADMIN = os.getenv('ENABLE_ADMIN', default='1') == '1'
+SERVE_API_DOCS = os.getenv('SERVE_API_DOCS', default='1') == '1'
+SCHEMA_FILE = os.getenv('SCHEMA_FILE', default=BASE_DIR / 'schema' / 'openapi.json')
+# seconds clients and proxies may reuse the built schema before revalidating its ETag
+SCHEMA_MAX_AGE = int(os.getenv('SCHEMA_MAX_AGE', default=24 * 60 * 60))
+
 INSTALLED_APPS = [
-    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
-    'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
     'rest_framework',
@@ -42,23 +51,33 @@ INSTALLED_APPS = [
     'allauth.socialaccount',
     'allauth.socialaccount.providers.google',
     'dj_rest_auth.registration',
-    'drf_spectacular',
 ]
+if ENABLE_ADMIN:
+    INSTALLED_APPS += ['django.contrib.admin', 'django.contrib.messages']
+if SERVE_API_DOCS:
+    INSTALLED_APPS += ['drf_spectacular']
 INSTALLED_APPS += [
     'users.apps.UsersConfig',
     'polls.apps.PollsConfig'
 ]
 
 MIDDLEWARE = [
+    'altvote.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'altvote.middleware.ReplicaRoutingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'altvote.middleware.ProfilingMiddleware',
 ]
+if ENABLE_ADMIN:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('altvote.middleware.ReplicaRoutingMiddleware') + 1,
+        'django.contrib.messages.middleware.MessageMiddleware'
+    )
 
 ROOT_URLCONF = 'altvote.urls'
 
@@ -72,11 +91,12 @@ TEMPLATES = [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
-                'django.contrib.messages.context_processors.messages',
             ],
         },
     },
 ]
+if ENABLE_ADMIN:
+    TEMPLATES[0]['OPTIONS']['context_processors'].append('django.contrib.messages.context_processors.messages')
 
 WSGI_APPLICATION = 'altvote.wsgi.application'
 
@@ -84,12 +104,13 @@ WSGI_APPLICATION = 'altvote.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+# DB_PROFILE: sqlite or postgres, see altvote/databases.py
+DATABASES = get_databases(BASE_DIR)
+
+DATABASE_ROUTERS = ['altvote.db_routers.PrimaryReplicaRouter']
+
+# how long a user's reads stay on the primary after they write
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=5))
 
 
 # Password validation
@@ -144,11 +165,20 @@ LOGIN_DIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_RENDERER_CLASSES': (
+        'altvote.renderers.ORJSONRenderer',
+    ) + (('rest_framework.renderers.BrowsableAPIRenderer',) if SERVE_API_DOCS else ()),
+    'DEFAULT_PARSER_CLASSES': (
+        'altvote.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     )
 }
+if SERVE_API_DOCS:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=6),
@@ -156,6 +186,9 @@ SIMPLE_JWT = {
     'UPDATE_LAST_LOGIN': True,
 }
 
+# seconds a user resolved from a JWT stays cached; entries are also dropped on save
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', default=5 * 60))
+
 REST_AUTH = {
     'USE_JWT': True,
     'JWT_AUTH_COOKIE': '_auth',
@@ -228,6 +261,67 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = "Europe/Berlin"
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
+CELERY_TASK_ROUTES = ('altvote.queues.route_task',)
+
+# messages waiting in a queue before enqueue() runs counter tasks inline and coalesces heavy ones
+QUEUE_BACKPRESSURE_DEPTH = int(os.getenv('QUEUE_BACKPRESSURE_DEPTH', default=1000))
+# seconds a coalesced task blocks duplicates if no worker picks it up
+QUEUE_COALESCE_TIMEOUT = 10 * 60
+# run with `celery -A altvote beat`
+CELERY_BEAT_SCHEDULE = {
+    'snapshot-tallies': {'task': 'polls.tasks.snapshot_tallies', 'schedule': 60.0},
+    'prune-tally-snapshots': {'task': 'polls.tasks.prune_tally_snapshots', 'schedule': 60 * 60.0},
+}
+
+# TRENDING POLLS
+# seconds after which an event counts half as much towards a poll's trending score
+TRENDING_HALF_LIFE = int(os.getenv('TRENDING_HALF_LIFE', default=2 * 60 * 60))
+TRENDING_WINDOW_MINUTES = 60
+TRENDING_MAX_POLLS = 1000
+
+# COMMENTS
+# replies embedded with each top-level comment; the rest are paged through the replies action
+COMMENT_INLINE_REPLIES = 3
+
+# TALLY HISTORY
+# seconds minute and hour snapshots are kept; day snapshots are kept for good
+TALLY_MINUTE_RETENTION = int(os.getenv('TALLY_MINUTE_RETENTION', default=2 * 24 * 60 * 60))
+TALLY_HOUR_RETENTION = int(os.getenv('TALLY_HOUR_RETENTION', default=90 * 24 * 60 * 60))
+# the most buckets one history response returns
+HISTORY_MAX_POINTS = 1440
+
+# DEMOGRAPHICS
+# seconds an open poll's cached age breakdown is served before new votes are aggregated into it
+DEMOGRAPHICS_REFRESH_INTERVAL = int(os.getenv('DEMOGRAPHICS_REFRESH_INTERVAL', default=60))
+# votes younger than this are left for the next refresh, their transactions may not have committed
+DEMOGRAPHICS_SETTLE_SECONDS = 30
+DEMOGRAPHICS_CACHE_TIMEOUT = 24 * 60 * 60
+
+# POLL METADATA CACHE
+# seconds a poll's cached metadata and options stay in Redis; changes replace them immediately
+POLL_CACHE_TIMEOUT = int(os.getenv('POLL_CACHE_TIMEOUT', default=10 * 60))
+
+# VOTER MEMBERSHIP
+# polls with more voters of a kind than this track them in a Bloom filter instead of a set
+VOTER_SET_MAX_SIZE = int(os.getenv('VOTER_SET_MAX_SIZE', default=10000))
+VOTER_BLOOM_ERROR_RATE = 0.01
+# seconds an idle poll's voter membership stays in Redis before it is rebuilt on demand
+VOTER_MEMBERSHIP_TIMEOUT = 7 * 24 * 60 * 60
+
+# CATEGORY CATALOG
+# seconds the serialized category list stays in Redis; changes replace it immediately
+CATEGORY_CATALOG_TIMEOUT = int(os.getenv('CATEGORY_CATALOG_TIMEOUT', default=24 * 60 * 60))
+
+# METRICS
+# buffered observations are merged into Redis at most once per interval per process
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', default=10))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# PROFILING
+PROFILING_DIR = os.getenv('PROFILING_DIR', default=BASE_DIR / 'profiles')
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', default=50))
+# lifetime in seconds of X-Profile header tokens
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', default=60 * 60))
 
 # LOGGING = {
 #     'version': 1,
@@ -0,0 +1,40 @@
+"""
+Settings for `manage.py loadtest`, runnable without Redis or a Celery worker.
+
+    python manage.py loadtest --settings=altvote.settings_loadtest
+
+The cache (and with it trending, metrics and the auth cache) talks to an
+in-process fakeredis server, and Celery tasks run eagerly in the request
+that queues them. Set LOADTEST_REDIS_URL to use a real local Redis instead,
+and LOADTEST_CELERY_EAGER=0 to publish tasks to it for real workers. The
+SQLite profile uses its own database file so runs never touch dev data.
+"""
+import os
+
+from altvote.settings import *  # noqa: F401,F403
+from altvote.settings import BASE_DIR, CACHES, DATABASES
+
+LOADTEST = True
+
+ALLOWED_HOSTS = ['testserver']
+
+# the router would send reads to replicas that never see the generated data
+DATABASES = {'default': DATABASES['default']}
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['NAME'] = os.getenv('LOADTEST_SQLITE_NAME', default=BASE_DIR / 'loadtest.sqlite3')
+
+LOADTEST_REDIS_URL = os.getenv('LOADTEST_REDIS_URL')
+if LOADTEST_REDIS_URL:
+    CACHES['default']['LOCATION'] = LOADTEST_REDIS_URL
+    CELERY_BROKER_URL = CELERY_RESULT_BACKEND = LOADTEST_REDIS_URL
+else:
+    from fakeredis import FakeConnection
+
+    CACHES['default']['OPTIONS'] = {
+        'db': '1',
+        'CONNECTION_POOL_KWARGS': {'connection_class': FakeConnection},
+    }
+    CELERY_BROKER_URL = 'memory://'
+    CELERY_RESULT_BACKEND = 'cache+memory://'
+
+CELERY_TASK_ALWAYS_EAGER = os.getenv('LOADTEST_CELERY_EAGER', default='1') == '1'
@@ -0,0 +1,161 @@
+import datetime
+import decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import router, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from redis.exceptions import RedisError
+from rest_framework.renderers import JSONRenderer
+
+from altvote import db_routers, metrics
+from altvote.middleware import ReplicaRoutingMiddleware
+from altvote.renderers import ORJSONRenderer
+from altvote.views import metrics_view
+from users.models import User
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    def assert_same_bytes(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_plain_payloads(self):
+        self.assert_same_bytes({
+            'id': 1,
+            'title': 'Poll \u2028 \u2029 ünïcode',
+            'options': [{'id': 2, 'votes': 0, 'image': None}, {'id': 3, 'votes': 2 ** 70}],
+            'created_at': datetime.datetime(2024, 5, 1, 12, 30, tzinfo=datetime.timezone.utc),
+            'end_date': datetime.date(2024, 6, 1),
+            'share': decimal.Decimal('0.125'),
+            'confirmed': True,
+        })
+
+    def test_decimals(self):
+        for value in ('0.1', '1E+16', '1E-7', '123456789.123'):
+            with self.subTest(value=value):
+                self.assert_same_bytes({'share': decimal.Decimal(value), 'nested': [[decimal.Decimal(value)]]})
+
+    def test_float_views_use_the_stdlib_renderer(self):
+        from altvote.views import ProfileListView
+        from polls.views import PollViewSet
+
+        for renderer_classes in (PollViewSet.trending.kwargs['renderer_classes'], ProfileListView.renderer_classes):
+            with self.subTest(renderer_classes=renderer_classes):
+                self.assertIn(JSONRenderer, renderer_classes)
+                self.assertNotIn(ORJSONRenderer, renderer_classes)
+
+
+@override_settings(METRICS_TOKEN='')
+@mock.patch.dict(metrics._gauges, clear=True)
+class MetricsViewTests(SimpleTestCase):
+    def tearDown(self):
+        metrics._pending.clear()
+
+    @mock.patch('altvote.metrics.get_connection', side_effect=RedisError('Redis is down'))
+    def test_scrape_without_redis_renders_this_process(self, get_connection):
+        metrics.REQUEST_QUERIES.observe(3, view='polls')
+        with self.assertLogs('altvote.views', 'ERROR'):
+            response = metrics_view(RequestFactory().get('/metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('altvote_http_request_sql_queries_count{view="polls"} 1.0', response.content.decode())
+
+
+@override_settings(CACHES=LOCAL_CACHE, REPLICA_STICKY_SECONDS=5)
+@mock.patch('altvote.db_routers.replica_aliases', return_value=['replica_1', 'replica_2'])
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    """Routing decisions against two nominal replica aliases; no query is sent to them."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='writer', email='writer@example.com')
+        self.other = User.objects.create(username='reader', email='reader@example.com')
+
+    def read_aliases(self, request, reads=1):
+        """Runs `request` through ReplicaRoutingMiddleware and returns the aliases its reads were routed to."""
+        router = db_routers.PrimaryReplicaRouter()
+        aliases = []
+
+        def view(request):
+            aliases.extend(router.db_for_read(User) for _ in range(reads))
+            return HttpResponse(status=getattr(request, 'status', 200))
+
+        ReplicaRoutingMiddleware(view)(request)
+        return aliases
+
+    def request(self, method, user, status=200):
+        request = getattr(RequestFactory(), method)('/api/v1/polls/')
+        request.user, request.status = user, status
+        return request
+
+    def test_safe_requests_read_from_one_replica(self, replica_aliases):
+        aliases = self.read_aliases(self.request('get', self.user), reads=5)
+        self.assertIn(aliases[0], ('replica_1', 'replica_2'))
+        self.assertEqual(set(aliases), {aliases[0]})
+
+    def test_unsafe_requests_read_from_the_primary(self, replica_aliases):
+        for method in ('post', 'put', 'patch', 'delete'):
+            with self.subTest(method=method):
+                self.assertEqual(self.read_aliases(self.request(method, self.user)), ['default'])
+
+    def test_reads_outside_requests_go_to_the_primary(self, replica_aliases):
+        self.assertEqual(db_routers.PrimaryReplicaRouter().db_for_read(User), 'default')
+
+    def test_reads_inside_atomic_go_to_the_primary(self, replica_aliases):
+        router = db_routers.PrimaryReplicaRouter()
+        request = self.request('get', self.other)
+        token = db_routers.current_request.set(request)
+        try:
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(User), 'default')
+            request.__dict__.pop('_db_for_read', None)
+            self.assertIn(router.db_for_read(User), ('replica_1', 'replica_2'))
+        finally:
+            db_routers.current_request.reset(token)
+
+    def test_writes_pin_the_writer_to_the_primary(self, replica_aliases):
+        self.read_aliases(self.request('post', self.user, status=201))
+
+        self.assertEqual(self.read_aliases(self.request('get', self.user)), ['default'])
+        # other users keep reading from replicas
+        self.assertIn(self.read_aliases(self.request('get', self.other))[0], ('replica_1', 'replica_2'))
+
+    def test_sticky_window_expires(self, replica_aliases):
+        self.read_aliases(self.request('post', self.user, status=201))
+        # what the cache does once REPLICA_STICKY_SECONDS have passed
+        cache.delete(db_routers.sticky_key(self.user.pk))
+
+        self.assertIn(self.read_aliases(self.request('get', self.user))[0], ('replica_1', 'replica_2'))
+
+    def test_failed_writes_are_not_sticky(self, replica_aliases):
+        self.read_aliases(self.request('post', self.user, status=400))
+        self.assertIn(self.read_aliases(self.request('get', self.user))[0], ('replica_1', 'replica_2'))
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ReplicaMirrorTests(TransactionTestCase):
+    """
+    Reads routed to a configured replica, which mirrors the primary in tests.
+
+    Runs when SQLITE_REPLICA_NAMES or POSTGRES_REPLICA_HOSTS configure replicas.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        if not db_routers.replica_aliases():
+            self.skipTest('no replicas configured')
+
+    def test_replica_reads_see_primary_writes(self):
+        user = User.objects.create(username='mirrored', email='mirrored@example.com')
+        request = RequestFactory().get('/api/v1/polls/')
+        request.user = user
+        token = db_routers.current_request.set(request)
+        try:
+            alias = router.db_for_read(User)
+            self.assertIn(alias, db_routers.replica_aliases())
+            self.assertEqual(User.objects.using(alias).get(pk=user.pk).username, 'mirrored')
+        finally:
+            db_routers.current_request.reset(token)
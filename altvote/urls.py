@@ -1,15 +1,32 @@
-from django.contrib import admin
+import os
+
+from django.conf import settings
 from django.urls import path, include
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
+from altvote.views import ProfileListView, metrics_view, schema_view
 from users.views import LoginPage
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('', include('users.urls')),
     path('api/v1/', include('polls.urls')),
     path('login/', LoginPage.as_view(), name='login'),
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/v1/profiles/', ProfileListView.as_view(), name='profiles'),
 ]
+
+if settings.ENABLE_ADMIN:
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
+
+if settings.SERVE_API_DOCS:
+    from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
+
+    urlpatterns += [
+        path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+        path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+        path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    ]
+elif os.path.exists(settings.SCHEMA_FILE):
+    # without the docs apps, the schema is the file built by `manage.py build_schema`
+    urlpatterns.append(path('api/schema/', schema_view, name='schema'))
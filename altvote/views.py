@@ -0,0 +1,59 @@
+import hashlib
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import etag, require_safe
+from redis.exceptions import RedisError
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from altvote import metrics, profiling
+from altvote.renderers import float_safe_renderers
+
+logger = logging.getLogger(__name__)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, protected by METRICS_TOKEN when it is set."""
+    if settings.METRICS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not constant_time_compare(token, settings.METRICS_TOKEN):
+            return HttpResponseForbidden()
+    try:
+        body = metrics.render()
+    except RedisError:
+        logger.exception('Metrics are unavailable in Redis, rendering this process only')
+        body = metrics.render(shared=False)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileListView(APIView):
+    """Lists the most recent request profiles stored by ProfilingMiddleware."""
+    permission_classes = (permissions.IsAdminUser,)
+    # durations are floats
+    renderer_classes = float_safe_renderers()
+
+    def get(self, request):
+        return Response(profiling.list_profiles())
+
+
+@lru_cache(maxsize=1)
+def load_schema(path):
+    """Returns the built schema file's `(content, etag)`; read once per process."""
+    with open(path, 'rb') as file:
+        content = file.read()
+    return content, f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+
+
+@require_safe
+@etag(lambda request: load_schema(str(settings.SCHEMA_FILE))[1])
+def schema_view(request):
+    """Serves the OpenAPI schema built by `manage.py build_schema`."""
+    response = HttpResponse(load_schema(str(settings.SCHEMA_FILE))[0], content_type='application/vnd.oai.openapi+json')
+    patch_cache_control(response, public=True, max_age=settings.SCHEMA_MAX_AGE)
+    return response
@@ -0,0 +1,112 @@
+"""
+The current user's activity feed: their ballots and comments, newest first.
+
+Simple votes, ranked ballots and comments are three streams, each read
+from an (author, created_at, id) index. Events are ordered by
+`(created_at, kind, id)` descending, and a page cursor holds that key of
+the page's last event. Every stream resumes strictly after the cursor and
+fetches at most a page plus one, and heapq.merge interleaves the streams.
+A page therefore costs three bounded index range scans and one query for
+poll titles, however long the user's history is.
+
+A ranked or preferential ballot is stored as one row per option; only its
+newest row is an event, which an EXISTS probe on the ballot's other rows
+decides.
+"""
+import base64
+import heapq
+import json
+from itertools import islice
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils.dateparse import parse_datetime
+
+from polls.models import Comment, Poll, RankedVote, SimpleVote
+
+# the tie-breaking order of events created at the same instant
+SIMPLE_VOTE = 'simple_vote'
+BALLOT = 'ballot'
+COMMENT = 'comment'
+KIND_RANKS = {SIMPLE_VOTE: 0, BALLOT: 1, COMMENT: 2}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(event):
+    key = {'t': event['created_at'].isoformat(), 'k': event['kind'], 'i': event['id']}
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at, kind, pk = parse_datetime(key['t']), key['k'], int(key['i'])
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid cursor.')
+    if created_at is None or kind not in KIND_RANKS:
+        raise InvalidCursor('Invalid cursor.')
+    return created_at, KIND_RANKS[kind], pk
+
+
+def after(queryset, kind, cursor):
+    """Filters a stream to the events that come after `cursor` in feed order."""
+    if cursor is None:
+        return queryset
+    created_at, kind_rank, pk = cursor
+    rank = KIND_RANKS[kind]
+    if rank < kind_rank:
+        return queryset.filter(created_at__lte=created_at)
+    if rank > kind_rank:
+        return queryset.filter(created_at__lt=created_at)
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+
+def streams(user, cursor, limit):
+    newest_row = ~Exists(
+        RankedVote.objects.filter(
+            author=user, poll=OuterRef('poll'), is_preferential=OuterRef('is_preferential')
+        ).filter(
+            Q(created_at__gt=OuterRef('created_at')) | Q(created_at=OuterRef('created_at'), id__gt=OuterRef('id'))
+        )
+    )
+    sources = (
+        (SIMPLE_VOTE, SimpleVote.objects.filter(author=user), ('option_id',)),
+        (BALLOT, RankedVote.objects.filter(newest_row, author=user), ('is_preferential',)),
+        (COMMENT, Comment.objects.filter(author=user), ('parent_id', 'content')),
+    )
+    for kind, queryset, fields in sources:
+        rows = after(queryset, kind, cursor).order_by('-created_at', '-id').values(
+            'id', 'poll_id', 'created_at', *fields
+        )[:limit]
+        yield [{'kind': kind, **row} for row in rows]
+
+
+def feed_key(event):
+    return event['created_at'], KIND_RANKS[event['kind']], event['id']
+
+
+def activity_page(user, cursor=None, limit=20):
+    """Returns `(events, next_cursor)`; next_cursor is None on the last page."""
+    cursor = decode_cursor(cursor) if cursor else None
+    merged = heapq.merge(*streams(user, cursor, limit + 1), key=feed_key, reverse=True)
+    events = list(islice(merged, limit + 1))
+    has_next = len(events) > limit
+    events = events[:limit]
+
+    titles = dict(Poll.objects.filter(pk__in={event['poll_id'] for event in events}).values_list('id', 'title'))
+    for event in events:
+        event['poll'] = {'id': event['poll_id'], 'title': titles.get(event['poll_id'])}
+    return events, encode_cursor(events[-1]) if has_next else None
+
+
+def represent(event):
+    data = {'type': event['kind'], 'created_at': event['created_at'], 'poll': event['poll']}
+    if event['kind'] == SIMPLE_VOTE:
+        data.update(id=event['id'], option=event['option_id'])
+    elif event['kind'] == BALLOT:
+        data['type'] = 'preferential_vote' if event['is_preferential'] else 'ranked_vote'
+    else:
+        data.update(id=event['id'], parent=event['parent_id'], content=event['content'])
+    return data
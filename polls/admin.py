@@ -5,5 +5,6 @@ from polls.models import Category
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'id')
+    list_display = ('name', 'id', 'polls_count')
     search_fields = ('name',)
+    readonly_fields = ('polls_count',)
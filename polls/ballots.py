@@ -0,0 +1,81 @@
+"""
+Set-based retraction of a user's ballot.
+
+The user's votes are removed with a single `DELETE ... RETURNING` that
+hands back exactly the rows it deleted, so the counters are decremented by
+what was really removed even under concurrent requests. Backends without
+RETURNING lock and read the rows first, then delete them by primary key.
+
+Votes are counted in the transaction that inserts them (see
+SimpleVoteSerializer.create), and the decrements here run in the one that
+deletes them, so a retraction never subtracts a vote that was not counted.
+"""
+from collections import Counter
+
+from django.db import connections, router, transaction
+
+from altvote.queues import enqueue
+from polls import counters, demographics, membership
+from polls.models import Option, RankedVote, SimpleVote
+from polls.tasks import on_tallies_changed
+
+TALLY_FIELDS = ('id', 'simple_votes', 'ranked_points', 'preferential_votes')
+
+
+def delete_returning(model, fields, **filters):
+    """Deletes the rows of `model` matching the equality `filters` and returns `fields` of each deleted row."""
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    opts = model._meta
+    # RETURNING on DELETE is available wherever it is on INSERT (PostgreSQL, SQLite 3.35+)
+    if connection.features.can_return_rows_from_bulk_insert:
+        quote = connection.ops.quote_name
+        where = ' AND '.join(f'{quote(opts.get_field(name).column)} = %s' for name in filters)
+        columns = ', '.join(quote(opts.get_field(name).column) for name in fields)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(opts.db_table)} WHERE {where} RETURNING {columns}',
+                [opts.get_field(name).get_db_prep_value(value, connection) for name, value in filters.items()]
+            )
+            return cursor.fetchall()
+
+    rows = list(model.objects.using(alias).select_for_update().filter(**filters).values_list('pk', *fields))
+    model.objects.using(alias).filter(pk__in=[row[0] for row in rows]).delete()
+    return [row[1:] for row in rows]
+
+
+def option_tallies(poll_id):
+    return list(Option.objects.filter(poll_id=poll_id).order_by('pk').values(*TALLY_FIELDS))
+
+
+def retract_simple_ballot(poll_id, author_id):
+    """Deletes the author's Simple Votes for the poll and returns the poll's updated tallies."""
+    with transaction.atomic():
+        rows = delete_returning(SimpleVote, ('option',), poll=poll_id, author=author_id)
+        retracted = Counter(option_id for option_id, in rows)
+        counters.apply_deltas('simple_votes', {option_id: -votes for option_id, votes in retracted.items()})
+        transaction.on_commit(lambda: membership.remove_voter(membership.SIMPLE, poll_id, author_id))
+        if rows:
+            transaction.on_commit(lambda: enqueue(on_tallies_changed, poll_pk=poll_id))
+        demographics.invalidate_on_commit(poll_id)
+        return option_tallies(poll_id)
+
+
+def retract_ranked_ballot(poll_id, author_id, is_preferential):
+    """Deletes the author's Ranked or Preferential Votes for the poll and returns the poll's updated tallies."""
+    with transaction.atomic():
+        rows = delete_returning(
+            RankedVote, ('option', 'points'), poll=poll_id, author=author_id, is_preferential=is_preferential
+        )
+        points_deltas, preferential_deltas = counters.ballot_deltas(rows, ())
+        if is_preferential:
+            counters.apply_preferential_deltas(preferential_deltas)
+        else:
+            counters.apply_deltas('ranked_points', points_deltas)
+        transaction.on_commit(
+            lambda: membership.remove_voter(membership.ranked_kind(is_preferential), poll_id, author_id)
+        )
+        if rows:
+            transaction.on_commit(lambda: enqueue(on_tallies_changed, poll_pk=poll_id))
+        demographics.invalidate_on_commit(poll_id)
+        return option_tallies(poll_id)
@@ -0,0 +1,79 @@
+"""
+Cached category catalog.
+
+The serialized category list is kept at two levels: in Redis under a
+versioned key, and in each process in a small LRU keyed by the same
+version. A request costs one Redis GET of the version; the list itself is
+only read from Redis (or rebuilt from the database) after the version
+changes. Invalidation replaces the version, which retires every process
+copy at once. Poll counts are maintained incrementally on Category.polls_count.
+"""
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from polls.models import Category
+
+VERSION_KEY = 'polls:categories:version'
+
+
+def catalog_key(version):
+    return f'polls:categories:{version}'
+
+
+def new_version():
+    # time-based, so a lost version key never brings back one still held in some process's LRU
+    return time.time_ns()
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+@lru_cache(maxsize=4)
+def load_catalog(version):
+    key = catalog_key(version)
+    catalog = cache.get(key)
+    if catalog is None:
+        from polls.serializers import CategorySerializer
+        # read from the primary, a lagging replica would cache stale counts under the new version
+        categories = Category.objects.using(router.db_for_write(Category)).order_by('pk')
+        catalog = [dict(item) for item in CategorySerializer(categories, many=True).data]
+        cache.set(key, catalog, settings.CATEGORY_CATALOG_TIMEOUT)
+    return catalog
+
+
+def get_catalog():
+    """Returns the serialized categories with their poll counts."""
+    return load_catalog(get_version())
+
+
+def invalidate_catalog():
+    cache.set(VERSION_KEY, new_version(), None)
+
+
+def invalidate_catalog_on_commit():
+    transaction.on_commit(invalidate_catalog)
+
+
+def adjust_polls_count(category_ids, delta=1):
+    """Adds `delta` to polls_count of every category once per occurrence in category_ids."""
+    counts = Counter(category_ids)
+    if not counts:
+        return
+    Category.objects.filter(pk__in=counts).update(
+        polls_count=F('polls_count') + Case(
+            *(When(pk=category_id, then=Value(count * delta)) for category_id, count in counts.items()),
+            output_field=IntegerField(),
+        )
+    )
+    invalidate_catalog_on_commit()
@@ -0,0 +1,119 @@
+"""
+Net updates of the denormalized vote counters on Option.
+
+Callers describe a change as per-option deltas; each helper applies them
+with a single UPDATE so a ballot touching every option costs one statement.
+Preferential tallies are JSON (`{points: votes}` with string keys) and are
+read under a row lock, adjusted, and written back with one bulk_update.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Tuple
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from polls.models import Comment, CommentDislike, CommentLike, Option, Poll, RankedVote, SimpleVote
+
+
+def apply_deltas(field: str, deltas: Dict[int, int]):
+    """Adds `deltas[option_id]` to the integer counter `field` of every option, skipping zeros."""
+    deltas = {option_id: delta for option_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Option.objects.filter(pk__in=deltas).update(**{
+        field: F(field) + Case(
+            *(When(pk=option_id, then=Value(delta)) for option_id, delta in deltas.items()),
+            output_field=IntegerField(),
+        )
+    })
+
+
+def apply_preferential_deltas(deltas: Dict[int, Dict[int, int]]):
+    """Adds `deltas[option_id][points]` to the number of ballots that gave the option those points."""
+    deltas = {
+        option_id: {points: delta for points, delta in by_points.items() if delta}
+        for option_id, by_points in deltas.items()
+    }
+    deltas = {option_id: by_points for option_id, by_points in deltas.items() if by_points}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        options = list(Option.objects.select_for_update().filter(pk__in=deltas).only('id', 'preferential_votes'))
+        for option in options:
+            tally = {str(points): votes for points, votes in (option.preferential_votes or {}).items()}
+            for points, delta in deltas[option.pk].items():
+                tally[str(points)] = tally.get(str(points), 0) + delta
+            option.preferential_votes = {points: votes for points, votes in tally.items() if votes}
+        Option.objects.bulk_update(options, ['preferential_votes'])
+
+
+def ballot_deltas(old: Iterable[Tuple[int, int]], new: Iterable[Tuple[int, int]]):
+    """
+    Diffs two ranked ballots given as `(option_id, points)` pairs.
+
+    Returns `(points_deltas, preferential_deltas)`: the change of each option's
+    ranked points, and of its per-points ballot count for preferential ballots.
+    """
+    points_deltas = Counter()
+    preferential_deltas = defaultdict(Counter)
+    for pairs, sign in ((old, -1), (new, 1)):
+        for option_id, points in pairs:
+            points_deltas[option_id] += sign * points
+            preferential_deltas[option_id][points] += sign
+    return dict(points_deltas), {option_id: dict(by_points) for option_id, by_points in preferential_deltas.items()}
+
+
+def find_drift(poll_ids):
+    """
+    Compares the denormalized counters of the given polls with the rows they summarize.
+
+    Returns a description of every counter that disagrees; an empty list
+    means the counters are consistent.
+    """
+    drift = []
+
+    simple = Counter(dict(
+        SimpleVote.objects.filter(poll_id__in=poll_ids).values('option_id').annotate(n=Count('pk'))
+        .values_list('option_id', 'n')
+    ))
+    ranked = Counter(dict(
+        RankedVote.objects.filter(poll_id__in=poll_ids, is_preferential=False).values('option_id')
+        .annotate(n=Sum('points')).values_list('option_id', 'n')
+    ))
+    preferential = defaultdict(dict)
+    for option_id, points, n in RankedVote.objects.filter(
+            poll_id__in=poll_ids, is_preferential=True
+    ).values('option_id', 'points').annotate(n=Count('pk')).values_list('option_id', 'points', 'n'):
+        preferential[option_id][str(points)] = n
+
+    for option_id, simple_votes, ranked_points, preferential_votes in Option.objects.filter(
+            poll_id__in=poll_ids
+    ).values_list('id', 'simple_votes', 'ranked_points', 'preferential_votes'):
+        if simple_votes != simple[option_id]:
+            drift.append(f'option {option_id} simple_votes={simple_votes}, expected {simple[option_id]}')
+        if ranked_points != ranked[option_id]:
+            drift.append(f'option {option_id} ranked_points={ranked_points}, expected {ranked[option_id]}')
+        tally = {points: votes for points, votes in (preferential_votes or {}).items() if votes}
+        if tally != preferential[option_id]:
+            drift.append(f'option {option_id} preferential_votes={tally}, expected {preferential[option_id]}')
+
+    comments = Poll.objects.filter(pk__in=poll_ids).annotate(n=Count('comments')).exclude(comments_count=F('n'))
+    for poll_id, comments_count, n in comments.values_list('id', 'comments_count', 'n'):
+        drift.append(f'poll {poll_id} comments_count={comments_count}, expected {n}')
+
+    for field, model, related in (
+            ('likes_count', CommentLike, 'comment'),
+            ('dislikes_count', CommentDislike, 'comment'),
+            ('replies_count', Comment, 'parent'),
+    ):
+        expected = Coalesce(Subquery(
+            model.objects.filter(**{related: OuterRef('pk')}).order_by().values(related)
+            .annotate(n=Count('pk')).values('n')
+        ), 0)
+        mismatched = Comment.objects.filter(poll_id__in=poll_ids).annotate(n=expected).exclude(**{field: F('n')})
+        for comment_id, value, n in mismatched.values_list('id', field, 'n'):
+            drift.append(f'comment {comment_id} {field}={value}, expected {n}')
+
+    return drift
@@ -0,0 +1,334 @@
+"""
+Synthetic dataset generation for `manage.py generate_dataset`.
+
+Polls get a Zipfian popularity: poll i (by rank) receives votes and
+comments in proportion to 1 / i^s. Every poll draws from its own RNG seeded
+from the run seed and its rank, so the data does not depend on batch sizes.
+Vote and comment rows are streamed into the database with explicit ids:
+COPY on PostgreSQL, executemany inside one transaction on SQLite, and
+bulk_create elsewhere. Secondary indexes on the bulk tables can be dropped
+for the load and rebuilt afterwards. Denormalized counters are accumulated
+while generating and written once at the end, so they match the rows.
+"""
+import random
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from polls.catalog import adjust_polls_count
+from polls.models import Category, Comment, Option, Poll, PollCategory, RankedVote, SimpleVote
+from users.models import User
+
+TIMESTAMP_POOL_SIZE = 4096
+BULK_TABLES = (SimpleVote, RankedVote, Comment)
+
+
+def zipf_cum_weights(n, exponent):
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+def split_budget(total, cum_weights):
+    """Splits `total` across ranks proportionally to their Zipf weights."""
+    scale = total / cum_weights[-1]
+    previous = 0.0
+    shares = []
+    for cumulative in cum_weights:
+        shares.append(round(cumulative * scale) - round(previous * scale))
+        previous = cumulative
+    return shares
+
+
+def next_id(model):
+    last = model.objects.order_by('-pk').values_list('pk', flat=True).first()
+    return (last or 0) + 1
+
+
+class Loader:
+    """Streams rows of `fields` into the table of `model` in batches of `batch_size`."""
+
+    def __init__(self, model, fields, batch_size):
+        self.model = model
+        self.fields = fields
+        self.batch_size = batch_size
+        self.loaded = 0
+
+    def load(self, rows):
+        if connection.vendor == 'postgresql':
+            self.copy(rows)
+        elif connection.vendor == 'sqlite':
+            self.executemany(rows)
+        else:
+            self.bulk_create(rows)
+
+    def columns(self):
+        quote = connection.ops.quote_name
+        return ', '.join(quote(self.model._meta.get_field(name).column) for name in self.fields)
+
+    def copy(self, rows):
+        sql = f'COPY {connection.ops.quote_name(self.model._meta.db_table)} ({self.columns()}) FROM STDIN'
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    self.loaded += 1
+
+    def executemany(self, rows):
+        sql = (
+            f'INSERT INTO {connection.ops.quote_name(self.model._meta.db_table)} ({self.columns()}) '
+            f'VALUES ({", ".join(["%s"] * len(self.fields))})'
+        )
+        rows = iter(rows)
+        with connection.cursor() as cursor:
+            while batch := list(islice(rows, self.batch_size)):
+                cursor.executemany(sql, batch)
+                self.loaded += len(batch)
+
+    def bulk_create(self, rows):
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            attnames = [self.model._meta.get_field(name).attname for name in self.fields]
+            self.model.objects.bulk_create(self.model(**dict(zip(attnames, row))) for row in batch)
+            self.loaded += len(batch)
+
+
+def drop_indexes(models):
+    """Drops the secondary indexes of `models` and returns what is needed to rebuild them."""
+    dropped = []
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            for name, constraint in connection.introspection.get_constraints(cursor, table).items():
+                if constraint['index'] and not constraint['unique'] and not constraint['primary_key']:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                    dropped.append((name, table, constraint['columns']))
+    return dropped
+
+
+def create_indexes(dropped):
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for name, table, columns in dropped:
+            cursor.execute(f'CREATE INDEX {quote(name)} ON {quote(table)} ({", ".join(map(quote, columns))})')
+
+
+class DatasetGenerator:
+    def __init__(self, seed, users, polls, votes, comments, min_options, max_options, zipf_exponent,
+                 simple_share, reply_ratio, days, batch_size, stdout):
+        self.seed = seed
+        self.users = users
+        self.polls = polls
+        self.votes = votes
+        self.comments = comments
+        self.min_options = min_options
+        self.max_options = max_options
+        self.zipf_exponent = zipf_exponent
+        self.simple_share = simple_share
+        self.reply_ratio = reply_ratio
+        self.days = days
+        self.batch_size = batch_size
+        self.stdout = stdout
+
+        self.now = timezone.now()
+        rng = random.Random(f'{seed}:timestamps')
+        self.timestamps = sorted(
+            connection.ops.adapt_datetimefield_value(self.now - timedelta(days=days * rng.random()))
+            for _ in range(TIMESTAMP_POOL_SIZE)
+        )
+
+    def rng(self, *scope):
+        return random.Random(':'.join(map(str, (self.seed, *scope))))
+
+    def run(self, drop_indexes_for_load=True):
+        user_ids = self.create_users()
+        poll_options = self.create_polls(user_ids)
+        cum_weights = zipf_cum_weights(len(poll_options), self.zipf_exponent)
+
+        dropped = drop_indexes(BULK_TABLES) if drop_indexes_for_load else []
+        try:
+            with transaction.atomic():
+                tallies = self.load_votes(user_ids, poll_options, split_budget(self.votes, cum_weights))
+                replies = self.load_comments(user_ids, poll_options, split_budget(self.comments, cum_weights))
+                self.write_counters(tallies, replies)
+        finally:
+            if dropped:
+                self.stdout.write(f'Rebuilding {len(dropped)} indexes')
+                create_indexes(dropped)
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Poll, Option, PollCategory, *BULK_TABLES]):
+                cursor.execute(sql)
+
+    def create_users(self):
+        first_id = next_id(User)
+        # one shared unusable password: hashing per user would dominate the run
+        password = make_password(None)
+        users = (
+            User(
+                id=user_id, username=f'user{user_id}', email=f'user{user_id}@example.com',
+                password=password, date_joined=self.now
+            )
+            for user_id in range(first_id, first_id + self.users)
+        )
+        while batch := list(islice(users, self.batch_size)):
+            User.objects.bulk_create(batch)
+        self.stdout.write(f'Created {self.users} users')
+        return list(range(first_id, first_id + self.users))
+
+    def create_polls(self, user_ids):
+        """Creates polls with options and categories, most popular first; returns `[(poll_id, [option_id, ...])]`."""
+        categories = list(Category.objects.values_list('pk', flat=True))
+        if not categories:
+            categories = [category.pk for category in Category.objects.bulk_create(
+                Category(name=name) for name in ('Politics', 'Technology', 'Sports', 'Culture', 'Science')
+            )]
+
+        poll_id, option_id = next_id(Poll), next_id(Option)
+        polls, options, poll_categories, poll_options = [], [], [], []
+        for rank in range(self.polls):
+            rng = self.rng('poll', rank)
+            polls.append(Poll(
+                id=poll_id, author_id=rng.choice(user_ids), title=f'Generated poll {poll_id}', is_confirmed=True,
+                created_at=self.now, updated_at=self.now
+            ))
+            for category_id in rng.sample(categories, rng.randint(1, min(2, len(categories)))):
+                poll_categories.append(PollCategory(poll_id=poll_id, category_id=category_id))
+            option_ids = list(range(option_id, option_id + rng.randint(self.min_options, self.max_options)))
+            options.extend(Option(id=pk, poll_id=poll_id, option=f'Option {pk}') for pk in option_ids)
+            poll_options.append((poll_id, option_ids))
+            poll_id, option_id = poll_id + 1, option_id + len(option_ids)
+
+        for model, objs in ((Poll, polls), (PollCategory, poll_categories), (Option, options)):
+            for start in range(0, len(objs), self.batch_size):
+                model.objects.bulk_create(objs[start:start + self.batch_size])
+
+        adjust_polls_count([poll_category.category_id for poll_category in poll_categories])
+        self.stdout.write(f'Created {len(polls)} polls with {len(options)} options')
+        return poll_options
+
+    def load_votes(self, user_ids, poll_options, budgets):
+        simple_votes = Counter()
+        ranked_points = Counter()
+        preferential_votes = defaultdict(Counter)
+        ids = {SimpleVote: next_id(SimpleVote), RankedVote: next_id(RankedVote)}
+
+        def simple_rows():
+            for rank, ((poll_id, option_ids), budget) in enumerate(zip(poll_options, budgets)):
+                rng = self.rng('simple', rank)
+                ballots = min(round(budget * self.simple_share), len(user_ids))
+                # a few options take most of the votes
+                weights = [rng.random() ** 2 for _ in option_ids]
+                choices = rng.choices(option_ids, weights, k=ballots)
+                simple_votes.update(choices)
+                stamps = rng.choices(self.timestamps, k=ballots)
+                for author_id, option_id, stamp in zip(rng.sample(user_ids, ballots), choices, stamps):
+                    yield ids[SimpleVote], author_id, poll_id, option_id, stamp, stamp
+                    ids[SimpleVote] += 1
+
+        def ranked_rows():
+            for rank, ((poll_id, option_ids), budget) in enumerate(zip(poll_options, budgets)):
+                rng = self.rng('ranked', rank)
+                length = len(option_ids)
+                points_range = range(1, length + 1)
+                # the rest of the budget is split between ranked and preferential ballots of `length` rows each
+                per_kind = min(round(budget * (1 - self.simple_share) / 2 / length), len(user_ids))
+                for is_preferential in (False, True):
+                    for author_id in rng.sample(user_ids, per_kind):
+                        stamp = rng.choice(self.timestamps)
+                        for option_id, points in zip(option_ids, rng.sample(points_range, length)):
+                            if is_preferential:
+                                preferential_votes[option_id][points] += 1
+                            else:
+                                ranked_points[option_id] += points
+                            yield ids[RankedVote], author_id, poll_id, option_id, stamp, stamp, points, is_preferential
+                            ids[RankedVote] += 1
+
+        vote_fields = ('id', 'author', 'poll', 'option', 'created_at', 'updated_at')
+        for model, fields, rows in (
+                (SimpleVote, vote_fields, simple_rows()),
+                (RankedVote, vote_fields + ('points', 'is_preferential'), ranked_rows()),
+        ):
+            loader = Loader(model, fields, self.batch_size)
+            loader.load(rows)
+            self.stdout.write(f'Loaded {loader.loaded} {model._meta.verbose_name_plural.lower()}')
+
+        return simple_votes, ranked_points, preferential_votes
+
+    def load_comments(self, user_ids, poll_options, budgets):
+        replies = Counter()
+        comments_count = {}
+        next_comment_id = [next_id(Comment)]
+
+        def rows():
+            for rank, ((poll_id, _), budget) in enumerate(zip(poll_options, budgets)):
+                rng = self.rng('comments', rank)
+                # a thread appears once plus once per reply, so busy threads attract more replies
+                threads = []
+                for _ in range(budget):
+                    comment_id = next_comment_id[0]
+                    next_comment_id[0] += 1
+                    parent_id = rng.choice(threads) if threads and rng.random() < self.reply_ratio else None
+                    if parent_id is None:
+                        threads.append(comment_id)
+                    else:
+                        threads.append(parent_id)
+                        replies[parent_id] += 1
+                    stamp = rng.choice(self.timestamps)
+                    yield (
+                        comment_id, rng.choice(user_ids), poll_id, parent_id, f'Generated comment {comment_id}',
+                        stamp, stamp, 0, 0, 0
+                    )
+                comments_count[poll_id] = budget
+
+        loader = Loader(
+            Comment,
+            ('id', 'author', 'poll', 'parent', 'content', 'created_at', 'updated_at',
+             'likes_count', 'dislikes_count', 'replies_count'),
+            self.batch_size
+        )
+        loader.load(rows())
+        self.stdout.write(f'Loaded {loader.loaded} comments')
+        return replies, comments_count
+
+    def write_counters(self, tallies, replies):
+        simple_votes, ranked_points, preferential_votes = tallies
+        replies_count, comments_count = replies
+        quote = connection.ops.quote_name
+        json_field = Option._meta.get_field('preferential_votes')
+
+        option_rows = [
+            (
+                simple_votes[option_id],
+                ranked_points[option_id],
+                json_field.get_db_prep_save(
+                    {str(points): votes for points, votes in sorted(preferential_votes[option_id].items())} or None,
+                    connection
+                ),
+                option_id,
+            )
+            for option_id in simple_votes.keys() | ranked_points.keys() | preferential_votes.keys()
+        ]
+        statements = (
+            (
+                f'UPDATE {quote(Option._meta.db_table)} SET {quote("simple_votes")} = %s, '
+                f'{quote("ranked_points")} = %s, {quote("preferential_votes")} = %s WHERE {quote("id")} = %s',
+                option_rows,
+            ),
+            (
+                f'UPDATE {quote(Poll._meta.db_table)} SET {quote("comments_count")} = %s WHERE {quote("id")} = %s',
+                [(count, poll_id) for poll_id, count in comments_count.items() if count],
+            ),
+            (
+                f'UPDATE {quote(Comment._meta.db_table)} SET {quote("replies_count")} = %s WHERE {quote("id")} = %s',
+                [(count, comment_id) for comment_id, count in replies_count.items()],
+            ),
+        )
+        with connection.cursor() as cursor:
+            for sql, rows in statements:
+                for start in range(0, len(rows), self.batch_size):
+                    cursor.executemany(sql, rows[start:start + self.batch_size])
+        self.stdout.write('Wrote counters')
@@ -0,0 +1,167 @@
+"""
+Poll results broken down by the voters' age bracket.
+
+Ages are taken on the day the poll was created, so a vote never changes
+bracket while the poll runs. Each vote table is read with one grouped
+aggregate that joins the author and maps date_of_birth to a bracket with a
+CASE over precomputed birth date thresholds.
+
+Breakdowns are cached per poll together with a created_at watermark. While
+a poll is open, reads within DEMOGRAPHICS_REFRESH_INTERVAL are served from
+the cache, and later ones only aggregate the votes created since the
+watermark. The watermark trails the clock by DEMOGRAPHICS_SETTLE_SECONDS so
+votes still in flight are not skipped. Revotes and retractions change
+existing rows, so they replace the poll's version and the next read starts
+over. Once the poll has ended and the settle time has passed, the
+breakdown is final and cached without expiry. Votes are read from the
+primary, so neither the watermark nor the final breakdown skips rows a
+replica has not caught up with.
+"""
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Case, CharField, Count, Value, When
+from django.utils import timezone
+
+from polls.models import RankedVote, SimpleVote
+
+UNKNOWN = 'unknown'
+# (label, lowest age); each bracket ends where the next begins
+AGE_BRACKETS = (
+    ('under_18', 0),
+    ('18-24', 18),
+    ('25-34', 25),
+    ('35-44', 35),
+    ('45-54', 45),
+    ('55-64', 55),
+    ('65+', 65),
+)
+BRACKETS = tuple(label for label, _ in AGE_BRACKETS) + (UNKNOWN,)
+
+
+def version_key(poll_id):
+    return f'polls:demographics:{poll_id}:version'
+
+
+def breakdown_key(poll_id):
+    return f'polls:demographics:{poll_id}'
+
+
+def get_version(poll_id):
+    key = version_key(poll_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate(poll_id):
+    cache.set(version_key(poll_id), time.time_ns(), None)
+
+
+def invalidate_on_commit(poll_id):
+    transaction.on_commit(lambda: invalidate(poll_id))
+
+
+def years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year - years, day=28)
+
+
+def age_bracket(reference):
+    """A CASE expression giving the author's age bracket on the `reference` date."""
+    whens = [When(author__date_of_birth__isnull=True, then=Value(UNKNOWN))]
+    # youngest first: born after the date someone turning the next bracket's age was born
+    for (label, _), (_, next_age) in zip(AGE_BRACKETS, AGE_BRACKETS[1:]):
+        whens.append(When(author__date_of_birth__gt=years_before(reference, next_age), then=Value(label)))
+    return Case(*whens, default=Value(AGE_BRACKETS[-1][0]), output_field=CharField())
+
+
+def aggregate(poll, since, until):
+    """
+    Counts the poll's votes created in [since, until) by option and age bracket.
+
+    Returns a Counter keyed by `('simple_votes', option_id, bracket)`,
+    `('ranked_points', option_id, bracket)` and
+    `('preferential_votes', option_id, bracket, points)`.
+    """
+    bracket = age_bracket(timezone.localdate(poll.created_at))
+    window = {'poll_id': poll.pk, 'created_at__lt': until}
+    if since is not None:
+        window['created_at__gte'] = since
+    tallies = Counter()
+    simple_votes = SimpleVote.objects.using(router.db_for_write(SimpleVote)).filter(**window)
+    ranked_votes = RankedVote.objects.using(router.db_for_write(RankedVote)).filter(**window)
+
+    for option_id, label, votes in simple_votes.annotate(
+            bracket=bracket
+    ).values('option_id', 'bracket').annotate(votes=Count('pk')).values_list('option_id', 'bracket', 'votes'):
+        tallies['simple_votes', option_id, label] += votes
+
+    for option_id, label, is_preferential, points, votes in ranked_votes.annotate(
+            bracket=bracket
+    ).values('option_id', 'bracket', 'is_preferential', 'points').annotate(votes=Count('pk')).values_list(
+        'option_id', 'bracket', 'is_preferential', 'points', 'votes'
+    ):
+        if is_preferential:
+            tallies['preferential_votes', option_id, label, points] += votes
+        else:
+            tallies['ranked_points', option_id, label] += points * votes
+
+    return tallies
+
+
+def get_breakdown(poll):
+    """Returns `(tallies, as_of, final)` for the poll (see aggregate), refreshing the cached breakdown if due."""
+    version = get_version(poll.pk)
+    entry = cache.get(breakdown_key(poll.pk))
+    if entry is not None and entry['version'] != version:
+        entry = None
+    if entry is not None and (
+            entry['final'] or time.time() < entry['refreshed_at'] + settings.DEMOGRAPHICS_REFRESH_INTERVAL
+    ):
+        return entry['tallies'], entry['as_of'], entry['final']
+
+    now = timezone.now()
+    settle = timedelta(seconds=settings.DEMOGRAPHICS_SETTLE_SECONDS)
+    # ballots validated just before the deadline may still be committing
+    final = poll.end_datetime is not None and now > poll.end_datetime + settle
+    until = now if final else now - settle
+    if entry is None:
+        tallies = aggregate(poll, None, until)
+    else:
+        tallies = entry['tallies'] + aggregate(poll, entry['as_of'], until)
+
+    entry = {'version': version, 'tallies': tallies, 'as_of': until, 'final': final, 'refreshed_at': time.time()}
+    cache.set(breakdown_key(poll.pk), entry, None if final else settings.DEMOGRAPHICS_CACHE_TIMEOUT)
+    return tallies, until, final
+
+
+def represent(poll, tallies):
+    """Lays the tallies out per option of the poll, with every bracket present."""
+    preferential = defaultdict(dict)
+    for (field, option_id, label, *points), votes in tallies.items():
+        if field == 'preferential_votes':
+            preferential[option_id, label][str(points[0])] = votes
+
+    return [
+        {
+            'id': option.pk,
+            'option': option.option,
+            'simple_votes': {label: tallies['simple_votes', option.pk, label] for label in BRACKETS},
+            'ranked_points': {label: tallies['ranked_points', option.pk, label] for label in BRACKETS},
+            'preferential_votes': {
+                label: dict(sorted(preferential[option.pk, label].items(), key=lambda item: int(item[0])))
+                for label in BRACKETS
+            },
+        }
+        for option in poll.options.all()
+    ]
@@ -0,0 +1,157 @@
+"""
+Tally history of polls for result charts.
+
+Every minute, polls with vote or comment activity, revotes or retractions
+(per the trending minute buckets and change sets) get their current option
+tallies written into PollTallySnapshot at all three resolutions at once:
+the minute row is new, while the hour and day rows of the current buckets
+are overwritten. Tallies are cumulative, so the last snapshot of a bucket
+is the bucket's value and the coarser rows are already the downsampled
+series. Pruning then only has to delete minute and hour rows past their
+retention.
+
+A snapshot packs the poll's options into one little-endian blob:
+
+    header     option count n, preferential width w         2 x uint16
+    option ids                                               n x uint64
+    simple votes, ranked points                           2 x n x int32
+    preferential votes, row per option, points 1..w           n*w x int32
+
+Counts are signed so a counter that drifted below zero is still recorded
+(blobs written before were uint32; the counts they hold read the same).
+"""
+import math
+import struct
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from polls import trending
+from polls.models import Option, PollTallySnapshot
+
+HEADER = struct.Struct('<HH')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def retention():
+    """Seconds each resolution is kept; None keeps it forever."""
+    return {
+        PollTallySnapshot.MINUTE: settings.TALLY_MINUTE_RETENTION,
+        PollTallySnapshot.HOUR: settings.TALLY_HOUR_RETENTION,
+        PollTallySnapshot.DAY: None,
+    }
+
+
+def pack(options):
+    """Packs `[(option_id, simple_votes, ranked_points, preferential_votes)]`, ordered by option id."""
+    n = len(options)
+    width = max((int(points) for *_, tally in options for points in (tally or {})), default=0)
+    values = [option_id for option_id, *_ in options]
+    counts = [simple for _, simple, _, _ in options] + [ranked for _, _, ranked, _ in options]
+    for *_, tally in options:
+        tally = {int(points): votes for points, votes in (tally or {}).items()}
+        counts.extend(tally.get(points, 0) for points in range(1, width + 1))
+    return HEADER.pack(n, width) + struct.pack(f'<{n}Q', *values) + struct.pack(f'<{len(counts)}i', *counts)
+
+
+def unpack(data):
+    data = bytes(data)
+    n, width = HEADER.unpack_from(data)
+    option_ids = struct.unpack_from(f'<{n}Q', data, HEADER.size)
+    counts = struct.unpack_from(f'<{2 * n + n * width}i', data, HEADER.size + 8 * n)
+    return {
+        'options': list(option_ids),
+        'simple_votes': list(counts[:n]),
+        'ranked_points': list(counts[n:2 * n]),
+        'preferential_votes': [list(counts[2 * n + i * width:2 * n + (i + 1) * width]) for i in range(n)],
+    }
+
+
+def bucket_start(moment, resolution):
+    seconds = int((moment - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+
+def take_snapshots(poll_ids, now=None):
+    """Writes the current tallies of the polls into their minute, hour and day buckets; returns the row count."""
+    now = timezone.now() if now is None else now
+    options = {}
+    for option in Option.objects.filter(poll_id__in=poll_ids).order_by('pk').values_list(
+            'poll_id', 'id', 'simple_votes', 'ranked_points', 'preferential_votes'
+    ):
+        options.setdefault(option[0], []).append(option[1:])
+
+    snapshots = [
+        PollTallySnapshot(
+            poll_id=poll_id, resolution=resolution, bucket=bucket_start(now, resolution), taken_at=now,
+            tallies=pack(poll_options)
+        )
+        for poll_id, poll_options in options.items()
+        for resolution, _ in PollTallySnapshot.RESOLUTIONS
+    ]
+    PollTallySnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=('poll', 'resolution', 'bucket'),
+        update_fields=('taken_at', 'tallies'),
+    )
+    return len(snapshots)
+
+
+def snapshot_active_polls(now=None):
+    """Snapshots the polls with activity since the previous run."""
+    now = timezone.now() if now is None else now
+    # the current and the previous minute, so events just before a run are not missed
+    poll_ids = trending.active_poll_ids(2, now=now.timestamp())
+    return take_snapshots(poll_ids, now) if poll_ids else 0
+
+
+def prune(now=None):
+    """Deletes snapshots past their resolution's retention; the coarser rows keep their history."""
+    now = timezone.now() if now is None else now
+    deleted = 0
+    for resolution, seconds in retention().items():
+        if seconds is not None:
+            deleted += PollTallySnapshot.objects.filter(
+                resolution=resolution, bucket__lt=now - timedelta(seconds=seconds)
+            ).delete()[0]
+    return deleted
+
+
+def stored_resolution(step, since, now):
+    """The coarsest stored resolution that is at most `step` and still retained at `since`."""
+    candidates = [
+        resolution for resolution, seconds in retention().items()
+        if seconds is None or since >= now - timedelta(seconds=seconds)
+    ]
+    finer = [resolution for resolution in candidates if resolution <= step]
+    return max(finer) if finer else min(candidates)
+
+
+def series(poll_id, step, since, until, now=None):
+    """
+    Returns the poll's tallies from `since` to `until` in buckets of `step` seconds.
+
+    Reads one stored resolution with a single range scan of the unique
+    index and keeps the last snapshot of every `step` bucket.
+    """
+    now = timezone.now() if now is None else now
+    resolution = stored_resolution(step, since, now)
+    rows = PollTallySnapshot.objects.filter(
+        poll_id=poll_id, resolution=resolution, bucket__gte=bucket_start(since, resolution), bucket__lt=until
+    ).order_by('bucket').values_list('bucket', 'taken_at', 'tallies')
+
+    points = {}
+    for bucket, taken_at, tallies in rows:
+        points[bucket_start(bucket, step)] = (taken_at, tallies)
+    return resolution, [
+        {'bucket': bucket, 'taken_at': taken_at, **unpack(tallies)}
+        for bucket, (taken_at, tallies) in points.items()
+    ]
+
+
+def default_step(since, until):
+    """The smallest whole-minute step that fits the range into HISTORY_MAX_POINTS buckets."""
+    seconds = (until - since).total_seconds() / settings.HISTORY_MAX_POINTS
+    return max(PollTallySnapshot.MINUTE, math.ceil(seconds / PollTallySnapshot.MINUTE) * PollTallySnapshot.MINUTE)
@@ -0,0 +1,90 @@
+"""
+Cached poll metadata for the vote endpoints.
+
+A vote needs the poll's end date and its options, not their counters, so
+`load_poll` returns a Poll limited to POLL_FIELDS with its options
+(OPTION_FIELDS) prefetched; every other field is deferred. As with the
+category catalog, the data is cached under a per-poll version in Redis and
+in a small per-process LRU keyed by that version, so a hot poll costs one
+Redis GET and no queries. Saving or deleting a poll or one of its options
+replaces the version once the transaction commits. Views memoize the loaded
+poll for the rest of the request (see PollLookupMixin).
+"""
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.http import Http404
+
+from polls.models import Option, Poll
+
+# in model field order, which Model.from_db expects of a partial row
+POLL_FIELDS = ('id', 'author_id', 'title', 'end_datetime', 'created_at', 'is_confirmed')
+OPTION_FIELDS = ('id', 'poll_id', 'option', 'image')
+LOCAL_CACHE_SIZE = 1024
+
+
+def version_key(poll_id):
+    return f'polls:poll:{poll_id}:version'
+
+
+def poll_key(poll_id, version):
+    return f'polls:poll:{poll_id}:{version}'
+
+
+def get_version(poll_id):
+    key = version_key(poll_id)
+    version = cache.get(key)
+    if version is None:
+        # time-based, so a version that expired is never handed out again
+        cache.add(key, time.time_ns(), settings.POLL_CACHE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+@lru_cache(maxsize=LOCAL_CACHE_SIZE)
+def load_rows(poll_id, version):
+    """Returns `(poll_values, option_values)` as tuples in POLL_FIELDS/OPTION_FIELDS order, None if no such poll."""
+    key = poll_key(poll_id, version)
+    rows = cache.get(key)
+    if rows is None:
+        # read from the primary, a lagging replica would cache stale data under the new version
+        alias = router.db_for_write(Poll)
+        poll = Poll.objects.using(alias).filter(pk=poll_id).values_list(*POLL_FIELDS).first()
+        if poll is None:
+            return None
+        options = list(Option.objects.using(alias).filter(poll_id=poll_id).order_by('pk').values_list(*OPTION_FIELDS))
+        rows = (poll, options)
+        cache.set(key, rows, settings.POLL_CACHE_TIMEOUT)
+    return rows
+
+
+def load_poll(poll_id):
+    """Returns a fresh Poll instance with its options prefetched, or raises Http404."""
+    rows = load_rows(int(poll_id), get_version(int(poll_id)))
+    if rows is None:
+        raise Http404('No Poll matches the given query.')
+
+    poll_values, option_values = rows
+    alias = router.db_for_write(Poll)
+    poll = Poll.from_db(alias, POLL_FIELDS, poll_values)
+    options = [Option.from_db(alias, OPTION_FIELDS, values) for values in option_values]
+    for option in options:
+        Option.poll.field.set_cached_value(option, poll)
+
+    # the same state prefetch_related leaves behind, so poll.options.all() needs no query
+    queryset = poll.options.all()
+    queryset._result_cache = options
+    queryset._prefetch_done = True
+    poll._prefetched_objects_cache = {'options': queryset}
+    return poll
+
+
+def invalidate_poll(poll_id):
+    cache.set(version_key(poll_id), time.time_ns(), settings.POLL_CACHE_TIMEOUT)
+
+
+def invalidate_poll_on_commit(poll_id):
+    transaction.on_commit(lambda: invalidate_poll(poll_id))
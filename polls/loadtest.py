@@ -0,0 +1,166 @@
+"""
+Mixed-traffic scenario driven by `manage.py loadtest`.
+
+Each virtual user belongs to one runner thread and picks its next action
+from MIX: browsing the poll list or a poll, casting a simple, ranked or
+preferential ballot on a poll it has not voted on yet, commenting, or
+toggling a like on a comment. Requests go through the full middleware and
+JWT authentication stack with Django's test client.
+"""
+import random
+import threading
+
+from django.contrib.auth.hashers import make_password
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from polls.catalog import adjust_polls_count
+from polls.models import Category, Comment, Option, Poll, PollCategory
+from users.models import User
+
+# relative weights of the actions
+MIX = {
+    'browse_list': 25,
+    'browse_poll': 25,
+    'simple_vote': 15,
+    'ranked_vote': 10,
+    'comment': 10,
+    'like': 15,
+}
+EXPECTED_STATUS = {
+    'browse_list': 200,
+    'browse_poll': 200,
+    'simple_vote': 201,
+    'ranked_vote': 201,
+    'comment': 201,
+    'like': 201,
+}
+
+
+def create_fixture(run_id, users, polls, options):
+    """Creates the users, polls and options of a run and returns `(user_ids, poll_options)`."""
+    password = make_password(None)
+    voters = User.objects.bulk_create(
+        User(username=f'load-{run_id}-{i}', email=f'load-{run_id}-{i}@example.com', password=password)
+        for i in range(users)
+    )
+    category, _ = Category.objects.get_or_create(name='Load test')
+    created = Poll.objects.bulk_create(
+        Poll(author=voters[i % len(voters)], title=f'Load test {run_id} #{i}') for i in range(polls)
+    )
+    PollCategory.objects.bulk_create(PollCategory(poll=poll, category=category) for poll in created)
+    adjust_polls_count([category.pk] * len(created))
+    Option.objects.bulk_create(
+        Option(poll=poll, option=f'Option {i}') for poll in created for i in range(options)
+    )
+
+    poll_options = {poll.pk: [] for poll in created}
+    for option_id, poll_id in Option.objects.filter(poll__in=created).order_by('pk').values_list('pk', 'poll_id'):
+        poll_options[poll_id].append(option_id)
+    return [voter.pk for voter in voters], poll_options
+
+
+class VirtualUser:
+    def __init__(self, user, poll_options, comments, rng):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        self.poll_options = poll_options
+        self.poll_ids = list(poll_options)
+        self.comments = comments
+        self.rng = rng
+        self.voted = set()
+
+    def next_action(self):
+        actions, weights = zip(*MIX.items())
+        return self.rng.choices(actions, weights)[0]
+
+    def run(self, action):
+        """Performs one action and returns its response status (None if it had nothing to act on)."""
+        return getattr(self, action)()
+
+    def pick_poll(self, kind):
+        candidates = [poll_id for poll_id in self.poll_ids if (poll_id, kind) not in self.voted]
+        if not candidates:
+            return None
+        poll_id = self.rng.choice(candidates)
+        self.voted.add((poll_id, kind))
+        return poll_id
+
+    def browse_list(self):
+        return self.client.get('/api/v1/polls/').status_code
+
+    def browse_poll(self):
+        return self.client.get(f'/api/v1/polls/{self.rng.choice(self.poll_ids)}/').status_code
+
+    def simple_vote(self):
+        poll_id = self.pick_poll('simple')
+        if poll_id is None:
+            return None
+        option_id = self.rng.choice(self.poll_options[poll_id])
+        return self.client.post(
+            f'/api/v1/polls/{poll_id}/simple_votes/', {'option': option_id}, format='json'
+        ).status_code
+
+    def ranked_vote(self):
+        is_preferential = self.rng.random() < 0.5
+        poll_id = self.pick_poll('preferential' if is_preferential else 'ranked')
+        if poll_id is None:
+            return None
+        option_ids = self.poll_options[poll_id]
+        points = self.rng.sample(range(1, len(option_ids) + 1), len(option_ids))
+        votes = [{'option': option_id, 'points': value} for option_id, value in zip(option_ids, points)]
+        return self.client.post(
+            f'/api/v1/polls/{poll_id}/ranked_votes/',
+            {'is_preferential': is_preferential, 'votes': votes},
+            format='json'
+        ).status_code
+
+    def comment(self):
+        poll_id = self.rng.choice(self.poll_ids)
+        data = {'content': f'Load test comment {self.rng.random():.6f}'}
+        parents = self.comments.get(poll_id)
+        if parents and self.rng.random() < 0.5:
+            data['parent'] = self.rng.choice(parents)
+        response = self.client.post(f'/api/v1/polls/{poll_id}/comments/', data, format='json')
+        if response.status_code == 201 and 'parent' not in data:
+            self.comments.add(poll_id, response.json()['id'])
+        return response.status_code
+
+    def like(self):
+        comment = self.comments.random(self.rng)
+        if comment is None:
+            return None
+        poll_id, comment_id = comment
+        return self.client.post(f'/api/v1/polls/{poll_id}/comments/{comment_id}/likes/').status_code
+
+
+class CommentPool:
+    """Top-level comments created during the run, shared by all threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_poll = {}
+        self.all = []
+
+    def add(self, poll_id, comment_id):
+        with self.lock:
+            self.by_poll.setdefault(poll_id, []).append(comment_id)
+            self.all.append((poll_id, comment_id))
+
+    def get(self, poll_id):
+        with self.lock:
+            return list(self.by_poll.get(poll_id, ()))
+
+    def random(self, rng):
+        with self.lock:
+            return rng.choice(self.all) if self.all else None
+
+
+def cleanup(run_id, poll_ids):
+    Comment.objects.filter(poll_id__in=poll_ids).delete()
+    Poll.objects.filter(pk__in=poll_ids).delete()
+    User.objects.filter(username__startswith=f'load-{run_id}-').delete()
+
+
+def make_rng(seed, worker):
+    return random.Random(f'{seed}:{worker}')
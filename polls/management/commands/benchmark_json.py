@@ -0,0 +1,67 @@
+import io
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Prefetch
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from altvote.parsers import ORJSONParser
+from altvote.renderers import ORJSONRenderer
+from polls.models import Comment, Poll
+from polls.serializers import CommentReadSerializer, PollSerializer
+from polls.views import PollViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compares the stdlib and orjson renderers/parsers on the largest API payloads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        payloads = {'poll list': PollSerializer(PollViewSet.queryset.all(), many=True).data}
+
+        busiest_poll = Poll.objects.annotate(total=Count('comments')).order_by('-total').first()
+        if busiest_poll:
+            comments = Comment.objects.filter(
+                poll=busiest_poll, parent__isnull=True
+            ).select_related('author').prefetch_related(
+                Prefetch(
+                    'replies',
+                    queryset=Comment.objects.select_related('author').order_by('created_at', 'id')[
+                        :settings.COMMENT_INLINE_REPLIES
+                    ],
+                    to_attr='first_replies'
+                )
+            )
+            payloads['comment tree'] = CommentReadSerializer(comments, many=True).data
+
+        for name, data in payloads.items():
+            self.benchmark(name, data, options['repeat'])
+
+    def benchmark(self, name, data, repeat):
+        stdlib_renderer, fast_renderer = JSONRenderer(), ORJSONRenderer()
+
+        rendered = stdlib_renderer.render(data)
+        if fast_renderer.render(data) != rendered:
+            self.stderr.write(self.style.ERROR(f'{name}: rendered bytes differ'))
+
+        stdlib_render = timeit.timeit(lambda: stdlib_renderer.render(data), number=repeat) / repeat
+        fast_render = timeit.timeit(lambda: fast_renderer.render(data), number=repeat) / repeat
+        stdlib_parse = timeit.timeit(lambda: self.parse(JSONParser(), rendered), number=repeat) / repeat
+        fast_parse = timeit.timeit(lambda: self.parse(ORJSONParser(), rendered), number=repeat) / repeat
+
+        self.stdout.write(f'{name} ({len(rendered) / 1024:.1f} KiB)')
+        self.stdout.write(self.row('render', stdlib_render, fast_render))
+        self.stdout.write(self.row('parse', stdlib_parse, fast_parse))
+
+    @staticmethod
+    def parse(parser, content):
+        return parser.parse(io.BytesIO(content), parser_context={'encoding': 'utf-8'})
+
+    @staticmethod
+    def row(label, baseline, candidate):
+        speedup = baseline / candidate if candidate else float('inf')
+        return f'  {label:<7} stdlib {baseline * 1000:8.2f} ms   orjson {candidate * 1000:8.2f} ms   x{speedup:.1f}'
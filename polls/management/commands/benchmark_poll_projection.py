@@ -0,0 +1,35 @@
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from polls.projections import project_polls
+from polls.serializers import PollSerializer
+from polls.views import PollViewSet
+
+
+class Command(BaseCommand):
+    help = 'Checks that project_polls matches PollSerializer output and compares their cost.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        queryset = PollViewSet.queryset.all()
+        renderer = JSONRenderer()
+
+        expected = renderer.render(PollSerializer(queryset.all(), many=True).data)
+        actual = renderer.render(project_polls(queryset.all()))
+        if expected != actual:
+            raise CommandError('project_polls output differs from PollSerializer output.')
+
+        polls_count = queryset.count() or 1
+        repeat = options['repeat']
+        serializer_time = timeit.timeit(
+            lambda: PollSerializer(queryset.all(), many=True).data, number=repeat
+        ) / repeat
+        projection_time = timeit.timeit(lambda: project_polls(queryset.all()), number=repeat) / repeat
+
+        self.stdout.write(f'{polls_count} polls, identical JSON')
+        self.stdout.write(f'  PollSerializer {serializer_time / polls_count * 1e6:8.1f} us/poll')
+        self.stdout.write(f'  project_polls  {projection_time / polls_count * 1e6:8.1f} us/poll')
@@ -0,0 +1,80 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+
+from polls.models import Option, Poll, SimpleVote
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures concurrent vote write throughput against the configured database profile. '
+        'Run once per DB_PROFILE to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--votes', type=int, default=500, help='Votes per writer.')
+
+    def handle(self, *args, **options):
+        writers, votes = options['writers'], options['votes']
+        run_id = uuid.uuid4().hex[:8]
+
+        author = User.objects.create(username=f'bench-{run_id}', email=f'bench-{run_id}@example.com')
+        voters = User.objects.bulk_create(
+            User(username=f'bench-{run_id}-{i}', email=f'bench-{run_id}-{i}@example.com')
+            for i in range(writers)
+        )
+        poll = Poll.objects.create(author=author, title=f'Write benchmark {run_id}')
+        option = Option.objects.create(poll=poll, option='Benchmark option')
+
+        errors = []
+        latencies = []
+        lock = threading.Lock()
+
+        def write(voter):
+            try:
+                for _ in range(votes):
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            SimpleVote.objects.create(author=voter, poll=poll, option=option)
+                            Option.objects.filter(pk=option.pk).update(simple_votes=F('simple_votes') + 1)
+                    except Exception as exc:
+                        with lock:
+                            errors.append(exc)
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(voter,)) for voter in voters]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        option.refresh_from_db()
+        stored = SimpleVote.objects.filter(poll=poll).count()
+        poll.delete()
+        User.objects.filter(pk__in=[author.pk, *(voter.pk for voter in voters)]).delete()
+
+        latencies.sort()
+        database = settings.DATABASES['default']
+        self.stdout.write(f"{database['ENGINE']} ({writers} writers x {votes} votes)")
+        self.stdout.write(f'  throughput   {len(latencies) / elapsed:10.1f} votes/s')
+        if latencies:
+            self.stdout.write(f'  p50 latency  {latencies[len(latencies) // 2] * 1000:10.2f} ms')
+            self.stdout.write(f'  p99 latency  {latencies[int(len(latencies) * 0.99)] * 1000:10.2f} ms')
+        self.stdout.write(f'  errors       {len(errors):10d}')
+        if errors:
+            self.stdout.write(f'  first error  {errors[0]!r}')
+        self.stdout.write(f'  consistent   {stored == option.simple_votes == len(latencies)}')
@@ -0,0 +1,26 @@
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from altvote.views import load_schema
+
+
+class Command(BaseCommand):
+    help = 'Renders the OpenAPI schema to SCHEMA_FILE, which api/schema/ serves when SERVE_API_DOCS is off.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=str(settings.SCHEMA_FILE))
+
+    def handle(self, *args, **options):
+        if not apps.is_installed('drf_spectacular'):
+            raise CommandError('drf_spectacular is not installed, run with SERVE_API_DOCS=1.')
+
+        path = options['file']
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        call_command('spectacular', format='openapi-json', file=path)
+
+        content, etag = load_schema(path)
+        self.stdout.write(f'{path}: {len(content) / 1024:.1f} KiB, ETag {etag}')
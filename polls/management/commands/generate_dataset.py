@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls import counters
+from polls.dataset import DatasetGenerator
+from polls.models import Poll
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates a reproducible synthetic dataset of users, polls, votes and comments with Zipfian poll '
+        'popularity and consistent counters. Rows are added to the existing data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--polls', type=int, default=1000)
+        parser.add_argument(
+            '--votes', type=int, default=1000000,
+            help='Approximate number of vote rows, capped at one ballot of each kind per user and poll.'
+        )
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--min-options', type=int, default=2)
+        parser.add_argument('--max-options', type=int, default=6)
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the poll popularity distribution.')
+        parser.add_argument(
+            '--simple-share', type=float, default=0.5,
+            help='Share of the vote rows cast as simple votes, the rest is split between ranked and preferential.'
+        )
+        parser.add_argument('--reply-ratio', type=float, default=0.6, help='Probability that a comment is a reply.')
+        parser.add_argument('--days', type=int, default=90, help='Spread of the vote and comment timestamps.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--keep-indexes', action='store_true',
+            help='Keep the secondary indexes of the vote and comment tables during the load.'
+        )
+        parser.add_argument('--check', type=int, default=20, help='Number of top polls whose counters are verified.')
+
+    def handle(self, *args, **options):
+        if not 2 <= options['min_options'] <= options['max_options']:
+            raise CommandError('Need 2 <= --min-options <= --max-options.')
+        if options['users'] < 1 or options['polls'] < 1:
+            raise CommandError('Need at least one user and one poll.')
+
+        first_poll = Poll.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        generator = DatasetGenerator(
+            seed=options['seed'],
+            users=options['users'],
+            polls=options['polls'],
+            votes=options['votes'],
+            comments=options['comments'],
+            min_options=options['min_options'],
+            max_options=options['max_options'],
+            zipf_exponent=options['zipf'],
+            simple_share=options['simple_share'],
+            reply_ratio=options['reply_ratio'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout,
+        )
+        start = time.perf_counter()
+        generator.run(drop_indexes_for_load=not options['keep_indexes'])
+        self.stdout.write(self.style.SUCCESS(f'Generated dataset in {time.perf_counter() - start:.1f} s'))
+
+        # polls are created most popular first, so these carry most of the rows
+        checked = list(range(first_poll + 1, first_poll + 1 + min(options['check'], options['polls'])))
+        drift = counters.find_drift(checked)
+        if drift:
+            raise CommandError(f'{len(drift)} inconsistent counters, e.g. {drift[0]}')
+        self.stdout.write(self.style.SUCCESS(f'Counters of {len(checked)} polls are consistent'))
+        self.stdout.write('Run rebuild_search_index to index the generated polls.')
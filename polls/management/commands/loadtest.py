@@ -0,0 +1,113 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from polls import counters, loadtest
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives mixed browse/vote/comment/like traffic at a given concurrency and reports throughput, '
+        'errors, latency percentiles and counter consistency. Run with --settings=altvote.settings_loadtest.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help='Runner threads.')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds of traffic.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--polls', type=int, default=20)
+        parser.add_argument('--options', type=int, default=4, help='Options per poll.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--settle', type=float, default=10.0,
+            help='Seconds to wait for queued counter updates to land before checking them.'
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the generated rows after the run.')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'LOADTEST', False):
+            raise CommandError('Refusing to write load test data with these settings, use altvote.settings_loadtest.')
+        call_command('migrate', verbosity=0, interactive=False)
+
+        concurrency = options['concurrency']
+        run_id = uuid.uuid4().hex[:8]
+        user_ids, poll_options = loadtest.create_fixture(
+            run_id, options['users'], options['polls'], options['options']
+        )
+        users = list(User.objects.filter(pk__in=user_ids).order_by('pk'))
+        comments = loadtest.CommentPool()
+
+        lock = threading.Lock()
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        deadline = time.perf_counter() + options['duration']
+
+        def run(worker):
+            rng = loadtest.make_rng(options['seed'], worker)
+            virtual_users = [
+                loadtest.VirtualUser(user, poll_options, comments, rng) for user in users[worker::concurrency]
+            ]
+            try:
+                while virtual_users and time.perf_counter() < deadline:
+                    virtual_user = rng.choice(virtual_users)
+                    action = virtual_user.next_action()
+                    start = time.perf_counter()
+                    try:
+                        status = virtual_user.run(action)
+                    except Exception:
+                        status = 'exception'
+                    elapsed = time.perf_counter() - start
+                    if status is None:
+                        continue
+                    with lock:
+                        latencies[action].append(elapsed)
+                        if status != loadtest.EXPECTED_STATUS[action]:
+                            errors[action] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(worker,)) for worker in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        drift = counters.find_drift(list(poll_options))
+        settle_deadline = time.monotonic() + options['settle']
+        while drift and time.monotonic() < settle_deadline:
+            time.sleep(0.5)
+            drift = counters.find_drift(list(poll_options))
+
+        self.report(concurrency, elapsed, latencies, errors, drift)
+        if not options['keep']:
+            loadtest.cleanup(run_id, list(poll_options))
+
+    def report(self, concurrency, elapsed, latencies, errors, drift):
+        total = sum(len(values) for values in latencies.values())
+        failed = sum(errors.values())
+        self.stdout.write(f'{settings.DATABASES["default"]["ENGINE"]}, {concurrency} threads, {elapsed:.1f} s')
+        self.stdout.write(f'  throughput  {total / elapsed:10.1f} req/s')
+        self.stdout.write(f'  error rate  {failed / total if total else 0.0:10.2%}')
+        self.stdout.write(f'  {"action":<12}{"count":>8}{"errors":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+        for action in loadtest.MIX:
+            values = sorted(latencies[action])
+            if not values:
+                continue
+            p50, p95, p99 = (values[min(int(len(values) * q), len(values) - 1)] * 1000 for q in (0.5, 0.95, 0.99))
+            self.stdout.write(
+                f'  {action:<12}{len(values):>8}{errors[action]:>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}'
+            )
+
+        if drift:
+            self.stdout.write(self.style.ERROR(f'  counters    {len(drift)} inconsistent, e.g. {drift[0]}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('  counters    consistent'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from altvote import profiling
+
+
+class Command(BaseCommand):
+    help = 'Prints a signed X-Profile header value that enables request profiling.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiling.make_token())
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from polls import search
+from polls.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index entries of all polls.'
+
+    def handle(self, *args, **options):
+        count = 0
+        for poll_id in Poll.objects.values_list('pk', flat=True).iterator():
+            search.index_poll(poll_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} polls.'))
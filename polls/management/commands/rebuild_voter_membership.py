@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from polls import membership
+from polls.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the Redis voter membership sets and Bloom filters of all or the given polls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_ids', nargs='*', type=int, help='Polls to rebuild, all polls if omitted.')
+        parser.add_argument('--kind', choices=membership.KINDS, help='Rebuild only this kind of ballot.')
+
+    def handle(self, *args, **options):
+        poll_ids = options['poll_ids'] or Poll.objects.order_by('pk').values_list('pk', flat=True).iterator()
+        kinds = [options['kind']] if options['kind'] else membership.KINDS
+        polls = voters = 0
+        for poll_id in poll_ids:
+            for kind in kinds:
+                voters += membership.rebuild(kind, poll_id)
+            polls += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt voter membership of {polls} polls ({voters} ballots).'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from altvote.celery import app
+from altvote.queues import QUEUES, WORKER_PROFILES
+
+
+class Command(BaseCommand):
+    help = 'Starts a Celery worker consuming one queue with that queue\'s concurrency and prefetch profile.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', choices=QUEUES)
+        parser.add_argument('--concurrency', type=int, help='Overrides the profile.')
+        parser.add_argument('--prefetch-multiplier', type=int, help='Overrides the profile.')
+        parser.add_argument('--loglevel', default='INFO')
+
+    def handle(self, *args, **options):
+        queue = options['queue']
+        profile = WORKER_PROFILES[queue]
+        app.worker_main(argv=[
+            'worker',
+            f'--queues={queue}',
+            f'--hostname={queue}@%h',
+            f'--concurrency={options["concurrency"] or profile["concurrency"]}',
+            f'--prefetch-multiplier={options["prefetch_multiplier"] or profile["prefetch_multiplier"]}',
+            f'--loglevel={options["loglevel"]}',
+        ])
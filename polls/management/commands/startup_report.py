@@ -0,0 +1,70 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# what a web worker does before serving its first request, timed in a fresh interpreter
+BOOT_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+boot = time.perf_counter() - start
+try:
+    # resident now; ru_maxrss would include the peak of the process that spawned this one
+    with open('/proc/self/status') as status:
+        rss = next(int(line.split()[1]) * 1024 for line in status if line.startswith('VmRSS:'))
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+print(json.dumps({'boot': boot, 'rss': rss, 'modules': len(sys.modules)}))
+'''
+PROFILES = {
+    'full': {'ENABLE_ADMIN': '1', 'SERVE_API_DOCS': '1'},
+    'production': {'ENABLE_ADMIN': '0', 'SERVE_API_DOCS': '0'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares worker boot time and memory with the admin and docs apps loaded and without them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, overrides in PROFILES.items():
+            env = {**os.environ, **overrides, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+            # the first run writes bytecode caches, so it is not counted
+            self.boot(env)
+            runs = [self.boot(env) for _ in range(options['repeat'])]
+            results[name] = {
+                'boot': statistics.median(run['boot'] for run in runs),
+                'rss': statistics.median(run['rss'] for run in runs),
+                'modules': runs[-1]['modules'],
+            }
+
+        self.stdout.write(f'{"profile":<12} {"boot":>10} {"rss":>11} {"modules":>8}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<12} {result["boot"] * 1000:7.0f} ms {result["rss"] / 2 ** 20:7.1f} MiB {result["modules"]:8}'
+            )
+        full, production = results['full'], results['production']
+        self.stdout.write(
+            f'production saves {(full["boot"] - production["boot"]) * 1000:.0f} ms and '
+            f'{(full["rss"] - production["rss"]) / 2 ** 20:.1f} MiB per worker, '
+            f'{full["modules"] - production["modules"]} fewer modules'
+        )
+
+    @staticmethod
+    def boot(env):
+        output = subprocess.run(
+            [sys.executable, '-c', BOOT_SCRIPT], env=env, cwd=settings.BASE_DIR, capture_output=True, text=True,
+            check=True
+        ).stdout
+        return json.loads(output.splitlines()[-1])
@@ -0,0 +1,259 @@
+"""
+"Already voted" membership of each poll's voters, kept in Redis.
+
+Every (kind, poll) pair has a state hash and one structure holding the ids
+of the users who cast a ballot of that kind: a set while the poll has at
+most VOTER_SET_MAX_SIZE voters, a Bloom filter (a plain bitmap addressed
+with SETBIT/GETBIT) beyond that. Both can only err towards "maybe voted",
+which callers confirm against the database; a "no" from a ready structure
+is final and saves the query. A ready state whose structure is missing (the
+cache evicted it) answers "maybe", and a failed add or remove drops the
+state, so a lost write never turns into a false "no".
+
+Structures are built from the database by `rebuild` (lazily through the
+on_voters_rebuild task, or with `manage.py rebuild_voter_membership`). The
+state is reset before the votes are read, and votes add themselves after
+their transaction commits, so a vote is either seen by the rebuild or added
+to the new structure. A set that outgrows its limit, or a Bloom filter past
+its capacity, schedules a rebuild into a larger structure.
+"""
+import hashlib
+import math
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError, WatchError
+
+from polls.models import RankedVote, SimpleVote
+
+KEY_PREFIX = 'polls:voters'
+SIMPLE = 'simple'
+RANKED = 'ranked'
+PREFERENTIAL = 'preferential'
+KINDS = (SIMPLE, RANKED, PREFERENTIAL)
+SET = 'set'
+BLOOM = 'bloom'
+
+# a rebuild that dies leaves the poll untracked for at most this long after its last write
+BUILD_TIMEOUT = 60
+BUILD_CHUNK_SIZE = 10000
+# probes of an untracked poll enqueue one rebuild per window rather than one each
+SCHEDULE_TIMEOUT = 60
+# kept in every set so that an empty one still exists; user ids start at 1
+SENTINEL = 0
+
+
+def ranked_kind(is_preferential):
+    return PREFERENTIAL if is_preferential else RANKED
+
+
+def state_key(kind, poll_id):
+    return f'{KEY_PREFIX}:{kind}:{poll_id}:state'
+
+
+def set_key(kind, poll_id):
+    return f'{KEY_PREFIX}:{kind}:{poll_id}:set'
+
+
+def bloom_key(kind, poll_id):
+    return f'{KEY_PREFIX}:{kind}:{poll_id}:bloom'
+
+
+def scheduled_key(kind, poll_id):
+    return f'{KEY_PREFIX}:{kind}:{poll_id}:scheduled'
+
+
+def voters(kind, poll_id):
+    """The users with a ballot of `kind` in the poll, read from the primary."""
+    if kind == SIMPLE:
+        queryset = SimpleVote.objects.filter(poll_id=poll_id)
+    else:
+        queryset = RankedVote.objects.filter(poll_id=poll_id, is_preferential=kind == PREFERENTIAL)
+    alias = router.db_for_write(queryset.model)
+    return queryset.using(alias).order_by().values_list('author_id', flat=True).distinct()
+
+
+def bloom_size(capacity):
+    """Returns `(bits, hashes)` of a Bloom filter for `capacity` members at VOTER_BLOOM_ERROR_RATE."""
+    bits = math.ceil(-capacity * math.log(settings.VOTER_BLOOM_ERROR_RATE) / math.log(2) ** 2)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def bloom_positions(user_id, bits, hashes):
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=16).digest()
+    first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+    return [(first + i * second) % bits for i in range(hashes)]
+
+
+def decode(state):
+    return {key.decode(): value.decode() for key, value in state.items()}
+
+
+def may_have_voted(kind, poll_id, user_id):
+    """
+    Returns False only if the user certainly has no ballot of `kind` in the poll.
+
+    An untracked poll answers True (and schedules its rebuild), as does an
+    unreachable Redis, so callers always fall back to the database.
+    """
+    try:
+        connection = get_redis_connection('default')
+        pipeline = connection.pipeline(transaction=False)
+        pipeline.hgetall(state_key(kind, poll_id))
+        pipeline.exists(set_key(kind, poll_id), bloom_key(kind, poll_id))
+        pipeline.sismember(set_key(kind, poll_id), user_id)
+        state, structures, in_set = pipeline.execute()
+        state = decode(state)
+        if not state or (state['ready'] == '1' and not structures):
+            schedule_rebuild(kind, poll_id)
+            return True
+        if state['ready'] != '1':
+            return True
+        if state['mode'] == SET:
+            return bool(in_set)
+
+        pipeline = connection.pipeline(transaction=False)
+        for position in bloom_positions(user_id, int(state['bits']), int(state['hashes'])):
+            pipeline.getbit(bloom_key(kind, poll_id), position)
+        return all(pipeline.execute())
+    except RedisError:
+        return True
+
+
+def forget(kind, poll_id):
+    """Drops the poll's state after a failed write, so reads fall back to the database until a rebuild."""
+    try:
+        get_redis_connection('default').delete(state_key(kind, poll_id))
+    except RedisError:
+        # the state expires after VOTER_MEMBERSHIP_TIMEOUT at the latest
+        pass
+
+
+def add_voter(kind, poll_id, user_id):
+    """Records a committed ballot; polls that are not tracked pick it up from the database when rebuilt."""
+    try:
+        write_voter(kind, poll_id, user_id)
+    except RedisError:
+        forget(kind, poll_id)
+
+
+def write_voter(kind, poll_id, user_id):
+    connection = get_redis_connection('default')
+    key = state_key(kind, poll_id)
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.hgetall(key)
+    pipeline.exists(set_key(kind, poll_id), bloom_key(kind, poll_id))
+    state, structures = pipeline.execute()
+    state = decode(state)
+    if not state:
+        return
+    if not structures:
+        # evicted, adding to a fresh structure would make it answer "no" for everyone else
+        forget(kind, poll_id)
+        return
+
+    pipeline = connection.pipeline()
+    if state['mode'] == SET:
+        structure_key, limit = set_key(kind, poll_id), settings.VOTER_SET_MAX_SIZE
+        pipeline.sadd(structure_key, user_id)
+        pipeline.scard(structure_key)
+    else:
+        structure_key, limit = bloom_key(kind, poll_id), int(state['capacity'])
+        pipeline.hincrby(key, 'count', 1)
+        for position in bloom_positions(user_id, int(state['bits']), int(state['hashes'])):
+            pipeline.setbit(structure_key, position, 1)
+    if state['ready'] == '1':
+        pipeline.expire(key, settings.VOTER_MEMBERSHIP_TIMEOUT)
+        pipeline.expire(structure_key, settings.VOTER_MEMBERSHIP_TIMEOUT)
+    else:
+        pipeline.expire(structure_key, BUILD_TIMEOUT)
+    results = pipeline.execute()
+    count = results[1] - 1 if state['mode'] == SET else results[0]
+
+    # only the add that crosses the limit schedules the rebuild
+    if count == limit + 1:
+        schedule_rebuild(kind, poll_id)
+
+
+def remove_voter(kind, poll_id, user_id):
+    """Forgets a retracted ballot; Bloom filters cannot forget and keep answering "maybe"."""
+    try:
+        get_redis_connection('default').srem(set_key(kind, poll_id), user_id)
+    except RedisError:
+        forget(kind, poll_id)
+
+
+def schedule_rebuild(kind, poll_id):
+    from altvote.queues import enqueue
+    from polls.tasks import on_voters_rebuild
+
+    # the marker is dropped when the rebuild starts
+    if cache.add(scheduled_key(kind, poll_id), 1, SCHEDULE_TIMEOUT):
+        enqueue(on_voters_rebuild, kind=kind, poll_id=poll_id)
+
+
+def rebuild(kind, poll_id):
+    """Rebuilds the membership of one poll from the database and returns the number of voters written."""
+    cache.delete(scheduled_key(kind, poll_id))
+    count = voters(kind, poll_id).count()
+    if count > settings.VOTER_SET_MAX_SIZE:
+        capacity = 2 * count
+        bits, hashes = bloom_size(capacity)
+        state = {'mode': BLOOM, 'capacity': capacity, 'bits': bits, 'hashes': hashes, 'count': 0}
+        structure_key = bloom_key(kind, poll_id)
+    else:
+        state = {'mode': SET}
+        structure_key = set_key(kind, poll_id)
+    generation = uuid.uuid4().hex
+    state.update(ready=0, generation=generation)
+
+    # from here on committed votes add themselves to the new structure
+    connection = get_redis_connection('default')
+    key = state_key(kind, poll_id)
+    pipeline = connection.pipeline()
+    pipeline.delete(key, set_key(kind, poll_id), bloom_key(kind, poll_id))
+    pipeline.hset(key, mapping=state)
+    if state['mode'] == SET:
+        pipeline.sadd(structure_key, SENTINEL)
+    else:
+        # allocates the bitmap, so the key exists before any voter is added
+        pipeline.setbit(structure_key, bits - 1, 0)
+    pipeline.expire(key, BUILD_TIMEOUT)
+    pipeline.expire(structure_key, BUILD_TIMEOUT)
+    pipeline.execute()
+
+    added = 0
+    user_ids = voters(kind, poll_id).iterator(chunk_size=BUILD_CHUNK_SIZE)
+    while chunk := list(islice(user_ids, BUILD_CHUNK_SIZE)):
+        pipeline = connection.pipeline(transaction=False)
+        if state['mode'] == SET:
+            pipeline.sadd(structure_key, *chunk)
+        else:
+            for user_id in chunk:
+                for position in bloom_positions(user_id, bits, hashes):
+                    pipeline.setbit(structure_key, position, 1)
+        pipeline.expire(key, BUILD_TIMEOUT)
+        pipeline.expire(structure_key, BUILD_TIMEOUT)
+        pipeline.execute()
+        added += len(chunk)
+
+    # publish only if no other rebuild has replaced the state meanwhile
+    with connection.pipeline() as pipeline:
+        pipeline.watch(key)
+        if pipeline.hget(key, 'generation') != generation.encode():
+            return added
+        pipeline.multi()
+        if state['mode'] == BLOOM:
+            pipeline.hincrby(key, 'count', added)
+        pipeline.hset(key, 'ready', 1)
+        pipeline.expire(key, settings.VOTER_MEMBERSHIP_TIMEOUT)
+        pipeline.expire(structure_key, settings.VOTER_MEMBERSHIP_TIMEOUT)
+        try:
+            pipeline.execute()
+        except WatchError:
+            pass
+    return added
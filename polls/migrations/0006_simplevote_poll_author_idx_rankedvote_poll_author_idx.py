@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_option_preferential_votes_option_ranked_points_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='simplevote',
+            index=models.Index(fields=['poll', 'author'], name='simplevote_poll_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rankedvote',
+            index=models.Index(fields=['poll', 'author', 'is_preferential'], name='rankedvote_poll_author_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE polls_poll_fts USING fts5("
+    "title, description, options, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO polls_poll_fts (rowid, title, description, options) "
+    "SELECT p.id, p.title, COALESCE(p.description, ''), "
+    "COALESCE((SELECT group_concat(o.option, ' ') FROM polls_option o WHERE o.poll_id = p.id), '') "
+    "FROM polls_poll p",
+]
+SQLITE_DROP = ['DROP TABLE IF EXISTS polls_poll_fts']
+
+POSTGRES_CREATE = [
+    'CREATE TABLE polls_poll_search ('
+    'poll_id bigint PRIMARY KEY REFERENCES polls_poll (id) ON DELETE CASCADE, '
+    'document tsvector NOT NULL)',
+    'CREATE INDEX polls_poll_search_document_idx ON polls_poll_search USING GIN (document)',
+    "INSERT INTO polls_poll_search (poll_id, document) "
+    "SELECT p.id, "
+    "setweight(to_tsvector('english', p.title), 'A') || "
+    "setweight(to_tsvector('english', COALESCE(p.description, '')), 'B') || "
+    "setweight(to_tsvector('english', COALESCE(("
+    "SELECT string_agg(o.option, ' ') FROM polls_option o WHERE o.poll_id = p.id), '')), 'C') "
+    "FROM polls_poll p",
+]
+POSTGRES_DROP = ['DROP TABLE IF EXISTS polls_poll_search']
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_simplevote_poll_author_idx_rankedvote_poll_author_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_polls_count(apps, schema_editor):
+    Category = apps.get_model('polls', 'Category')
+    PollCategory = apps.get_model('polls', 'PollCategory')
+    counts = PollCategory.objects.filter(
+        category=OuterRef('pk')
+    ).order_by().values('category').annotate(count=Count('pk')).values('count')
+    Category.objects.using(schema_editor.connection.alias).update(
+        polls_count=Coalesce(Subquery(counts), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_poll_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='polls_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Polls Count'),
+        ),
+        migrations.RunPython(backfill_polls_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-19 10:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_replies_count(apps, schema_editor):
+    Comment = apps.get_model('polls', 'Comment')
+    counts = Comment.objects.filter(
+        parent=OuterRef('pk')
+    ).order_by().values('parent').annotate(count=Count('pk')).values('count')
+    Comment.objects.using(schema_editor.connection.alias).filter(parent__isnull=True).update(
+        replies_count=Coalesce(Subquery(counts), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_category_polls_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Replies Count'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'created_at', 'id'], name='comment_parent_created_idx'),
+        ),
+        migrations.RunPython(backfill_replies_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_comment_replies_count_comment_parent_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollTallySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, 'Minute'), (3600, 'Hour'), (86400, 'Day')], verbose_name='Resolution')),
+                ('bucket', models.DateTimeField(verbose_name='Bucket Start')),
+                ('taken_at', models.DateTimeField(verbose_name='Taken At')),
+                ('tallies', models.BinaryField(verbose_name='Packed Tallies')),
+                ('poll', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tally_snapshots', to='polls.poll', verbose_name='Poll')),
+            ],
+            options={
+                'verbose_name': 'Poll Tally Snapshot',
+                'verbose_name_plural': 'Poll Tally Snapshots',
+                'constraints': [models.UniqueConstraint(fields=('poll', 'resolution', 'bucket'), name='tallysnapshot_poll_bucket_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-19 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_polltallysnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='comment_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rankedvote',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='rankedvote_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simplevote',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='simplevote_author_created_idx'),
+        ),
+    ]
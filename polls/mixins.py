@@ -1,6 +1,8 @@
 from rest_framework.mixins import ListModelMixin, CreateModelMixin
 from rest_framework.viewsets import GenericViewSet
 
+from polls.loaders import load_poll
+
 
 class ListCreateMixin(
     ListModelMixin,
@@ -8,3 +10,12 @@ class ListCreateMixin(
     GenericViewSet
 ):
     pass
+
+
+class PollLookupMixin:
+    """Loads the Poll of a nested route once per request (views are instantiated per request)."""
+
+    def get_poll(self):
+        if not hasattr(self, '_poll'):
+            self._poll = load_poll(self.kwargs['poll_pk'])
+        return self._poll
@@ -8,6 +8,10 @@ class Category(models.Model):
         verbose_name='Category Name',
         max_length=60,
     )
+    polls_count = models.PositiveIntegerField(
+        verbose_name='Polls Count',
+        default=0
+    )
 
     class Meta:
         verbose_name = 'Polls Category'
@@ -152,6 +156,10 @@ class SimpleVote(BaseVote):
     class Meta:
         verbose_name = 'Simple Vote'
         verbose_name_plural = 'Simple Votes'
+        indexes = (
+            models.Index(fields=('poll', 'author'), name='simplevote_poll_author_idx'),
+            models.Index(fields=('author', 'created_at', 'id'), name='simplevote_author_created_idx'),
+        )
 
     def __str__(self) -> str:
         return f'{self.author} on {self.poll} votes {self.option}'
@@ -169,6 +177,10 @@ class RankedVote(BaseVote):
     class Meta:
         verbose_name = 'Ranked Vote'
         verbose_name_plural = 'Ranked Votes'
+        indexes = (
+            models.Index(fields=('poll', 'author', 'is_preferential'), name='rankedvote_poll_author_idx'),
+            models.Index(fields=('author', 'created_at', 'id'), name='rankedvote_author_created_idx'),
+        )
 
     def __str__(self) -> str:
         return f'{self.author} on {self.poll} ranks {self.option} at {self.points}'
@@ -212,10 +224,18 @@ class Comment(models.Model):
         verbose_name='Dislikes Count',
         default=0
     )
+    replies_count = models.PositiveIntegerField(
+        verbose_name='Replies Count',
+        default=0
+    )
 
     class Meta:
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
+        indexes = [
+            models.Index(fields=['parent', 'created_at', 'id'], name='comment_parent_created_idx'),
+            models.Index(fields=['author', 'created_at', 'id'], name='comment_author_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.author} comments on {self.poll}: "{self.content[:20]}..."'
@@ -263,3 +283,46 @@ class CommentDislike(models.Model):
 
     def __str__(self) -> str:
         return f'{self.author} dislikes {self.comment.id} comment'
+
+
+class PollTallySnapshot(models.Model):
+    MINUTE = 60
+    HOUR = 60 * 60
+    DAY = 24 * 60 * 60
+    RESOLUTIONS = (
+        (MINUTE, 'Minute'),
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    )
+
+    poll = models.ForeignKey(
+        verbose_name='Poll',
+        on_delete=models.CASCADE,
+        related_name='tally_snapshots',
+        to='polls.Poll',
+        # the unique constraint's index leads with poll
+        db_index=False
+    )
+    resolution = models.PositiveIntegerField(
+        verbose_name='Resolution',
+        choices=RESOLUTIONS
+    )
+    bucket = models.DateTimeField(
+        verbose_name='Bucket Start'
+    )
+    taken_at = models.DateTimeField(
+        verbose_name='Taken At'
+    )
+    tallies = models.BinaryField(
+        verbose_name='Packed Tallies'
+    )
+
+    class Meta:
+        verbose_name = 'Poll Tally Snapshot'
+        verbose_name_plural = 'Poll Tally Snapshots'
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'resolution', 'bucket'], name='tallysnapshot_poll_bucket_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.poll} tallies at {self.bucket} ({self.get_resolution_display()})'
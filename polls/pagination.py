@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class SearchPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
+
+
+class RepliesPagination(CursorPagination):
+    # keyset pages stay as cheap deep into a thread as on its first page
+    ordering = ('created_at', 'id')
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
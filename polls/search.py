@@ -0,0 +1,140 @@
+"""
+Full-text search over poll titles, descriptions and option texts.
+
+The index lives outside the ORM (see migration 0007): an FTS5 virtual table
+on SQLite and a tsvector table with a GIN index on PostgreSQL. Other
+backends fall back to unindexed `icontains` matching.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from polls.models import Option, Poll
+
+SQLITE_TABLE = 'polls_poll_fts'
+POSTGRES_TABLE = 'polls_poll_search'
+POSTGRES_CONFIG = 'english'
+
+# bm25 weights of the title, description and options columns
+SQLITE_RANK = f'bm25({SQLITE_TABLE}, 10.0, 4.0, 2.0)'
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector(%(config)s, %(title)s), 'A') || "
+    "setweight(to_tsvector(%(config)s, %(description)s), 'B') || "
+    "setweight(to_tsvector(%(config)s, %(options)s), 'C')"
+)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def index_poll(poll_id):
+    """(Re)builds the index entry of a poll, or drops it if the poll is gone."""
+    alias = router.db_for_write(Poll)
+    poll = Poll.objects.using(alias).filter(pk=poll_id).values('title', 'description').first()
+    if poll is None:
+        remove_poll(poll_id)
+        return
+
+    options = ' '.join(Option.objects.using(alias).filter(poll_id=poll_id).values_list('option', flat=True))
+    params = {
+        'poll_id': poll_id,
+        'title': poll['title'],
+        'description': poll['description'] or '',
+        'options': options,
+        'config': POSTGRES_CONFIG,
+    }
+
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [poll_id])
+            cursor.execute(
+                f'INSERT INTO {SQLITE_TABLE} (rowid, title, description, options) VALUES (%s, %s, %s, %s)',
+                [poll_id, params['title'], params['description'], params['options']]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f'INSERT INTO {POSTGRES_TABLE} (poll_id, document) '
+                f'VALUES (%(poll_id)s, {POSTGRES_DOCUMENT}) '
+                f'ON CONFLICT (poll_id) DO UPDATE SET document = EXCLUDED.document',
+                params
+            )
+
+
+def remove_poll(poll_id):
+    connection = connections[router.db_for_write(Poll)]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s', [poll_id])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DELETE FROM {POSTGRES_TABLE} WHERE poll_id = %s', [poll_id])
+
+
+def sqlite_match_expression(query):
+    # every word must match, as a prefix so partially typed words find results
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+class PollSearchResults:
+    """
+    Lazily evaluated, rank-ordered ids of polls matching a query.
+
+    Supports `count()` and slicing so it can be handed to DRF paginators;
+    each page is a single LIMIT/OFFSET query against the index.
+    """
+
+    def __init__(self, query):
+        self.query = query.strip()
+        self.alias = router.db_for_read(Poll)
+        self.connection = connections[self.alias]
+
+    def count(self):
+        if not TOKEN_RE.search(self.query):
+            return 0
+        if self.connection.vendor == 'sqlite':
+            sql = f'SELECT count(*) FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s'
+            params = [sqlite_match_expression(self.query)]
+        elif self.connection.vendor == 'postgresql':
+            sql = (
+                f'SELECT count(*) FROM {POSTGRES_TABLE} '
+                f'WHERE document @@ websearch_to_tsquery(%s, %s)'
+            )
+            params = [POSTGRES_CONFIG, self.query]
+        else:
+            return self.fallback_queryset().count()
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, page):
+        if not TOKEN_RE.search(self.query):
+            return []
+        limit, offset = page.stop - page.start, page.start
+        if self.connection.vendor == 'sqlite':
+            sql = (
+                f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s '
+                f'ORDER BY {SQLITE_RANK} LIMIT %s OFFSET %s'
+            )
+            params = [sqlite_match_expression(self.query), limit, offset]
+        elif self.connection.vendor == 'postgresql':
+            sql = (
+                f'SELECT poll_id FROM {POSTGRES_TABLE}, websearch_to_tsquery(%s, %s) AS query '
+                f'WHERE document @@ query ORDER BY ts_rank_cd(document, query) DESC, poll_id DESC '
+                f'LIMIT %s OFFSET %s'
+            )
+            params = [POSTGRES_CONFIG, self.query, limit, offset]
+        else:
+            return list(self.fallback_queryset()[page])
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def fallback_queryset(self):
+        queryset = Poll.objects.using(self.alias)
+        for token in TOKEN_RE.findall(self.query):
+            queryset = queryset.filter(
+                Q(title__icontains=token) | Q(description__icontains=token) | Q(options__option__icontains=token)
+            )
+        return queryset.distinct().order_by('-pk').values_list('pk', flat=True)
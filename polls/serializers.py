@@ -1,11 +1,19 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from drf_extra_fields.fields import Base64ImageField
+from altvote.queues import enqueue
+from polls import counters, demographics, membership
+from polls.catalog import adjust_polls_count
 from polls.models import Category, Comment, Option, Poll, PollCategory, SimpleVote, RankedVote
 from polls.utils import poll_end_datetime_passed
-from polls.tasks import on_ranked_votes, on_simple_vote
+from polls.tasks import on_tallies_changed, on_vote
 from users.models import User
 
 
+BATCH_MAX_POLLS = 500
+
+
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -15,7 +23,8 @@ class AuthorSerializer(serializers.ModelSerializer):
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'polls_count')
+        read_only_fields = ('polls_count',)
 
 
 class OptionSerializer(serializers.ModelSerializer):
@@ -39,6 +48,10 @@ class PollSerializer(serializers.ModelSerializer):
         queryset=Category.objects.all(), many=True
     )
     options = OptionSerializer(many=True)
+    # annotated by PollViewSet.get_queryset, omitted for non-annotated instances
+    has_simple_vote = serializers.BooleanField(read_only=True)
+    has_ranked_vote = serializers.BooleanField(read_only=True)
+    has_preferential_vote = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Poll
@@ -53,7 +66,10 @@ class PollSerializer(serializers.ModelSerializer):
             'comments_count',
             'created_at', 
             'updated_at', 
-            'is_confirmed'
+            'is_confirmed',
+            'has_simple_vote',
+            'has_ranked_vote',
+            'has_preferential_vote'
         )
         read_only_fields = (
             'comments_count',
@@ -70,6 +86,10 @@ class PollSerializer(serializers.ModelSerializer):
         repr['categories'] = categories_slugs
         return repr
 
+    def validate_categories(self, categories):
+        # a category listed twice would get two PollCategory rows and count the poll twice
+        return list(dict.fromkeys(categories))
+
     def create(self, validated_data):
         categories = validated_data.pop('categories')
         options = validated_data.pop('options')
@@ -78,6 +98,7 @@ class PollSerializer(serializers.ModelSerializer):
 
         poll_categories = [PollCategory(poll=poll, category=category) for category in categories]
         PollCategory.objects.bulk_create(poll_categories)
+        adjust_polls_count(category.pk for category in categories)
 
         poll_options = [Option(poll=poll, **option_kwargs) for option_kwargs in options]
         Option.objects.bulk_create(poll_options)
@@ -92,6 +113,7 @@ class PollSerializer(serializers.ModelSerializer):
 
         poll_categories = [PollCategory(poll=instance, category=category) for category in categories]
         PollCategory.objects.bulk_create(poll_categories)
+        adjust_polls_count(category.pk for category in categories)
 
         poll_options = [Option(poll=instance, **option_kwargs) for option_kwargs in options]
         Option.objects.bulk_create(poll_options)
@@ -102,8 +124,67 @@ class PollSerializer(serializers.ModelSerializer):
         return instance
 
 
+class PollBatchItemSerializer(PollSerializer):
+    # resolved for the whole batch at once by PollBatchSerializer.validate_polls
+    categories = serializers.ListField(child=serializers.IntegerField(min_value=1))
+
+
+class PollBatchSerializer(serializers.Serializer):
+    polls = PollBatchItemSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_POLLS)
+
+    def validate_polls(self, polls):
+        category_ids = {category_id for poll in polls for category_id in poll['categories']}
+        categories = Category.objects.in_bulk(category_ids)
+
+        missing = sorted(category_ids - categories.keys())
+        if missing:
+            raise serializers.ValidationError(f'Categories do not exist: {", ".join(map(str, missing))}.')
+
+        for poll in polls:
+            poll['categories'] = [categories[category_id] for category_id in poll['categories']]
+        return polls
+
+    def create(self, validated_data):
+        author = validated_data['author']
+        items = validated_data['polls']
+
+        with transaction.atomic():
+            polls = Poll.objects.bulk_create(
+                Poll(
+                    author=author,
+                    **{key: val for key, val in item.items() if key not in ('categories', 'options')}
+                )
+                for item in items
+            )
+            PollCategory.objects.bulk_create(
+                PollCategory(poll=poll, category=category)
+                for poll, item in zip(polls, items)
+                for category in item['categories']
+            )
+            adjust_polls_count(category.pk for item in items for category in item['categories'])
+            Option.objects.bulk_create(
+                Option(poll=poll, **option_kwargs)
+                for poll, item in zip(polls, items)
+                for option_kwargs in item['options']
+            )
+
+        return polls
+
+
+class PollOptionField(serializers.PrimaryKeyRelatedField):
+    """Resolves options of the context's poll from its prefetched options before querying."""
+
+    def to_internal_value(self, data):
+        poll = self.context.get('poll')
+        if poll is not None:
+            for option in poll.options.all():
+                if str(option.pk) == str(data):
+                    return option
+        return super().to_internal_value(data)
+
+
 class SimpleVoteSerializer(serializers.ModelSerializer):
-    option = serializers.PrimaryKeyRelatedField(queryset=Option.objects.all())
+    option = PollOptionField(queryset=Option.objects.all())
 
     class Meta:
         model = SimpleVote
@@ -111,13 +192,18 @@ class SimpleVoteSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at')
 
     def create(self, validated_data):
-        on_simple_vote.delay(option_pk=validated_data['option'].id, created=True)
-        return super().create(validated_data)
+        # counted in the insert's transaction, so a revote or retraction never subtracts an uncounted vote
+        with transaction.atomic():
+            vote = super().create(validated_data)
+            counters.apply_deltas('simple_votes', {vote.option_id: 1})
+            transaction.on_commit(lambda: membership.add_voter(membership.SIMPLE, vote.poll_id, vote.author_id))
+            transaction.on_commit(lambda: enqueue(on_vote, poll_pk=vote.poll_id))
+        return vote
 
     def validate_option(self, option):
-        poll = self.instance.poll if self.instance else self.context['poll']
+        poll_id = self.instance.poll_id if self.instance else self.context['poll'].pk
 
-        if option.poll != poll:
+        if option.poll_id != poll_id:
             raise serializers.ValidationError('This option is not available for this poll.')
 
         return option
@@ -128,16 +214,27 @@ class SimpleVoteSerializer(serializers.ModelSerializer):
         if poll_end_datetime_passed(poll):
             raise serializers.ValidationError({'error': 'The poll has been finished.'})
 
-        if SimpleVote.objects.filter(
-                poll=poll, author=self.context['author']
-        ).exists():
+        author = self.context['author']
+        if self.instance is None and membership.may_have_voted(
+                membership.SIMPLE, poll.pk, author.pk
+        ) and SimpleVote.objects.filter(poll=poll, author=author).exists():
             raise serializers.ValidationError({'error': 'You have already voted for this poll.'})
 
         return attrs
 
+    def update(self, instance, validated_data):
+        previous_option_id = instance.option_id
+        with transaction.atomic():
+            vote = super().update(instance, validated_data)
+            if vote.option_id != previous_option_id:
+                counters.apply_deltas('simple_votes', {previous_option_id: -1, vote.option_id: 1})
+                transaction.on_commit(lambda: enqueue(on_tallies_changed, poll_pk=vote.poll_id))
+                demographics.invalidate_on_commit(vote.poll_id)
+        return vote
+
 
 class RankedVoteOptionSerializer(serializers.ModelSerializer):
-    option = serializers.PrimaryKeyRelatedField(queryset=Option.objects.all())
+    option = PollOptionField(queryset=Option.objects.all())
     points = serializers.IntegerField()
 
     class Meta:
@@ -168,18 +265,17 @@ class RankedVoteWriteSerializer(serializers.Serializer):
         if is_preferential:
             preferential_points = list(range(1, len(poll_options) + 1))
 
+        # a revote (see update) replaces the existing ballot instead
+        author = self.context['author']
+        if self.instance is None and membership.may_have_voted(
+                membership.ranked_kind(is_preferential), poll.pk, author.pk
+        ) and RankedVote.objects.filter(poll=poll, author=author, is_preferential=is_preferential).exists():
+            raise serializers.ValidationError({'error': 'You have already voted for this poll.'})
+
         for ranked_option in attrs['votes']:
             option = ranked_option.get('option')
             points = ranked_option.get('points')
 
-            if RankedVote.objects.filter(
-                    poll=poll,
-                    author=self.context['author'],
-                    option=option,
-                    is_preferential=is_preferential
-            ).exists():
-                raise serializers.ValidationError({'error': 'You have already voted for this option.'})
-
             if option not in poll_options:
                 raise serializers.ValidationError(
                     {'options': f'The {option.id} option is duplicated or not available for this poll.'}
@@ -218,20 +314,77 @@ class RankedVoteWriteSerializer(serializers.Serializer):
             )
             for vote_data in validated_data['votes']
         ]
-        RankedVote.objects.bulk_create(votes)
-
-        options_points = {vote_data['option'].id: vote_data['points'] for vote_data in validated_data['votes']}
-        on_ranked_votes.delay(options_dict=options_points, created=True, ranked=True)
+        # counted in the insert's transaction, as for simple votes
+        with transaction.atomic():
+            RankedVote.objects.bulk_create(votes)
+            points_deltas, preferential_deltas = counters.ballot_deltas(
+                (), [(vote.option_id, vote.points) for vote in votes]
+            )
+            if is_preferential:
+                counters.apply_preferential_deltas(preferential_deltas)
+            else:
+                counters.apply_deltas('ranked_points', points_deltas)
+            transaction.on_commit(
+                lambda: membership.add_voter(membership.ranked_kind(is_preferential), poll.pk, author.pk)
+            )
+            transaction.on_commit(lambda: enqueue(on_vote, poll_pk=poll.pk))
 
         return {
             'votes': votes,
             'is_preferential': is_preferential
         }
 
+    def update(self, instance, validated_data):
+        """
+        Replaces the author's ballot of the same kind with the validated one.
+
+        `instance` is a queryset of the author's votes for the poll. Only the
+        votes whose points changed are written, and the option counters get
+        the net difference between the two ballots.
+        """
+        poll = self.context['poll']
+        author = self.context['author']
+        is_preferential = validated_data['is_preferential']
+        new_points = {vote_data['option'].id: vote_data['points'] for vote_data in validated_data['votes']}
+
+        with transaction.atomic():
+            votes = list(instance.select_for_update().filter(is_preferential=is_preferential))
+            if not votes:
+                raise serializers.ValidationError({'error': 'You have not voted for this poll yet.'})
+            old_points = {vote.option_id: vote.points for vote in votes}
+
+            now = timezone.now()
+            changed = []
+            for vote in votes:
+                if vote.option_id in new_points and vote.points != new_points[vote.option_id]:
+                    vote.points, vote.updated_at = new_points[vote.option_id], now
+                    changed.append(vote)
+            RankedVote.objects.bulk_update(changed, ['points', 'updated_at'])
+
+            # options only differ if the poll's options changed since the first vote
+            RankedVote.objects.filter(pk__in=[vote.pk for vote in votes if vote.option_id not in new_points]).delete()
+            added = RankedVote.objects.bulk_create(
+                RankedVote(poll=poll, author=author, option_id=option_id, points=points, is_preferential=is_preferential)
+                for option_id, points in new_points.items()
+                if option_id not in old_points
+            )
 
-class CommentReadSerializer(serializers.ModelSerializer):
+            points_deltas, preferential_deltas = counters.ballot_deltas(old_points.items(), new_points.items())
+            if is_preferential:
+                counters.apply_preferential_deltas(preferential_deltas)
+            else:
+                counters.apply_deltas('ranked_points', points_deltas)
+            transaction.on_commit(lambda: enqueue(on_tallies_changed, poll_pk=poll.pk))
+            demographics.invalidate_on_commit(poll.pk)
+
+        return {
+            'votes': [vote for vote in votes if vote.option_id in new_points] + added,
+            'is_preferential': is_preferential
+        }
+
+
+class CommentReplySerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
-    replies = serializers.SerializerMethodField()
     liked_by_current_user = serializers.SerializerMethodField()
     disliked_by_current_user = serializers.SerializerMethodField()
 
@@ -247,14 +400,9 @@ class CommentReadSerializer(serializers.ModelSerializer):
             'liked_by_current_user',
             'disliked_by_current_user',
             'created_at',
-            'updated_at',
-            'replies'
+            'updated_at'
         )
 
-    def get_replies(self, obj):
-        replies = obj.replies.all()
-        return CommentReadSerializer(replies, many=True).data
-
     def get_liked_by_current_user(self, obj):
         return hasattr(obj, 'author_likes') and len(obj.author_likes) > 0
 
@@ -262,16 +410,34 @@ class CommentReadSerializer(serializers.ModelSerializer):
         return hasattr(obj, 'author_dislikes') and len(obj.author_dislikes) > 0
 
 
+class CommentReadSerializer(CommentReplySerializer):
+    replies = serializers.SerializerMethodField()
+
+    class Meta(CommentReplySerializer.Meta):
+        fields = CommentReplySerializer.Meta.fields + ('replies_count', 'replies')
+
+    def get_replies(self, obj):
+        # only the first replies are prefetched (see CommentViewSet), the rest come from the replies action
+        return CommentReplySerializer(obj.first_replies, many=True, context=self.context).data
+
+
 class CommentWriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = (
-            'id', 'parent', 'content', 'likes_count', 'dislikes_count', 'created_at', 'updated_at'
+            'id', 'parent', 'content', 'likes_count', 'dislikes_count', 'replies_count', 'created_at', 'updated_at'
         )
         read_only_fields = (
-            'id', 'created_at', 'updated_at', 'likes_count', 'dislikes_count'
+            'id', 'created_at', 'updated_at', 'likes_count', 'dislikes_count', 'replies_count'
         )
 
+    def get_extra_kwargs(self):
+        extra_kwargs = super().get_extra_kwargs()
+        if self.instance is not None:
+            # moving a comment would leave both parents' replies_count wrong
+            extra_kwargs['parent'] = {**extra_kwargs.get('parent', {}), 'read_only': True}
+        return extra_kwargs
+
     def validate(self, attrs):
         poll_id = int(self.context['poll_id'])
 
@@ -283,3 +449,26 @@ class CommentWriteSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError('Child comment must only belong to a top-level comment.')
 
         return attrs
+
+
+# the feed is built by activity.represent; these serializers only describe it for the API schema
+class ActivityPollSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField(allow_null=True)
+
+
+class ActivityEventSerializer(serializers.Serializer):
+    """An entry of the activity feed; the fields beyond `poll` depend on its type."""
+    type = serializers.ChoiceField(choices=('simple_vote', 'ranked_vote', 'preferential_vote', 'comment'))
+    created_at = serializers.DateTimeField()
+    poll = ActivityPollSerializer()
+    id = serializers.IntegerField(required=False, help_text='Simple Votes and Comments only.')
+    option = serializers.IntegerField(required=False, help_text='Simple Votes only.')
+    parent = serializers.IntegerField(required=False, allow_null=True, help_text='Comments only.')
+    content = serializers.CharField(required=False, help_text='Comments only.')
+
+
+class ActivityPageSerializer(serializers.Serializer):
+    """A page of the activity feed, newest first; `next` is null on the last page."""
+    next = serializers.URLField(allow_null=True)
+    results = ActivityEventSerializer(many=True)
@@ -0,0 +1,47 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from altvote.queues import enqueue
+from polls import demographics
+from polls.catalog import adjust_polls_count, invalidate_catalog_on_commit
+from polls.loaders import invalidate_poll_on_commit
+from polls.models import Category, Option, Poll, PollCategory
+from polls.tasks import on_poll_deleted
+
+
+@receiver(post_delete, sender=Poll)
+def on_poll_delete(sender, instance, **kwargs):
+    enqueue(on_poll_deleted, poll_pk=instance.pk)
+
+
+# PollSerializer replaces options with bulk_create but always saves the poll afterwards
+@receiver(post_save, sender=Poll)
+@receiver(post_delete, sender=Poll)
+def on_poll_change(sender, instance, **kwargs):
+    invalidate_poll_on_commit(instance.pk)
+    # an edit may move the end date or replace the options
+    demographics.invalidate_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+def on_option_change(sender, instance, **kwargs):
+    invalidate_poll_on_commit(instance.poll_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def on_category_change(sender, instance, **kwargs):
+    invalidate_catalog_on_commit()
+
+
+# bulk_create sends no signals, so the serializers count their inserts themselves
+@receiver(post_save, sender=PollCategory)
+def on_poll_category_save(sender, instance, created, **kwargs):
+    if created:
+        adjust_polls_count([instance.category_id])
+
+
+@receiver(post_delete, sender=PollCategory)
+def on_poll_category_delete(sender, instance, **kwargs):
+    adjust_polls_count([instance.category_id], delta=-1)
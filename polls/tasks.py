@@ -1,96 +1,88 @@
-from contextlib import suppress
-from typing import Dict
+from typing import List
 
 from celery import shared_task
-from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import F
 
-from polls.models import Comment, CommentLike, CommentDislike, Poll, Option
-from users.models import User
+from polls import history, membership, search, trending
+from polls.models import Comment, CommentLike, CommentDislike, Poll
 
 
 @shared_task
-def on_simple_vote(option_pk: int, created: bool):
-    option = Option.objects.get(pk=option_pk)
-    if created:
-        option.votes += 1
-    else:
-        option.votes -= 1
-    option.save()
+def on_vote(poll_pk: int):
+    # the option counters are updated in the vote's own transaction, see SimpleVoteSerializer.create
+    trending.record_event(poll_pk)
 
 
 @shared_task
-def on_ranked_votes(options_dict: Dict[int, int], created: bool, ranked: bool):
-    options_to_update = []
-    for option_pk, points in options_dict.items():
-        option = Option.objects.get(pk=option_pk)
-
-        if created:
-            if ranked:
-                option.ranked_points += points
-            else:
-                if not option.preferential_votes:
-                    option.preferential_votes = {points: 1}
-                else:
-                    option.preferential_votes[points] = option.preferential_votes.get(points, 0) + 1
-
-        else:
-            if ranked:
-                option.ranked_points -= points
-            else:
-                option.preferential_votes[points] -= 1
-
-        options_to_update.append(option)
-    Option.objects.bulk_update(
-        options_to_update,
-        ['ranked_points'] if ranked else ['preferential_votes']
-    )
+def on_tallies_changed(poll_pk: int):
+    # a revote or retraction: not trending activity, but the poll's tally history must be snapshotted
+    trending.record_change(poll_pk)
 
 
 @shared_task
 def on_like(comment_pk: int, user_pk: int):
-    comment = Comment.objects.get(pk=comment_pk)
-    user = User.objects.get(pk=user_pk)
+    with transaction.atomic():
+        unliked, _ = CommentLike.objects.filter(author_id=user_pk, comment_id=comment_pk).delete()
+        if unliked:
+            Comment.objects.filter(pk=comment_pk).update(likes_count=F('likes_count') - unliked)
+            return
+
+        undisliked, _ = CommentDislike.objects.filter(author_id=user_pk, comment_id=comment_pk).delete()
+        CommentLike.objects.create(author_id=user_pk, comment_id=comment_pk)
+        Comment.objects.filter(pk=comment_pk).update(
+            likes_count=F('likes_count') + 1, dislikes_count=F('dislikes_count') - undisliked
+        )
 
-    try:
-        comment_like = CommentLike.objects.get(author=user, comment=comment)
-        comment_like.delete()
-        comment.likes_count -= 1
-        comment.save()
-    except CommentLike.DoesNotExist:
 
-        with suppress(ObjectDoesNotExist):
-            CommentDislike.objects.get(author=user, comment=comment).delete()
+@shared_task
+def on_dislike(comment_pk: int, user_pk: int):
+    with transaction.atomic():
+        undisliked, _ = CommentDislike.objects.filter(author_id=user_pk, comment_id=comment_pk).delete()
+        if undisliked:
+            Comment.objects.filter(pk=comment_pk).update(dislikes_count=F('dislikes_count') - undisliked)
+            return
 
-        CommentLike.objects.create(author=user, comment=comment)
-        comment.likes_count += 1
-        comment.save()
+        unliked, _ = CommentLike.objects.filter(author_id=user_pk, comment_id=comment_pk).delete()
+        CommentDislike.objects.create(author_id=user_pk, comment_id=comment_pk)
+        Comment.objects.filter(pk=comment_pk).update(
+            dislikes_count=F('dislikes_count') + 1, likes_count=F('likes_count') - unliked
+        )
 
 
 @shared_task
-def on_dislike(comment_pk: int, user_pk: int):
-    comment = Comment.objects.get(pk=comment_pk)
-    user = User.objects.get(pk=user_pk)
+def on_comment(poll_pk: int, created: bool, count: int = 1):
+    Poll.objects.filter(pk=poll_pk).update(comments_count=F('comments_count') + (count if created else -count))
+    if created:
+        trending.record_event(poll_pk, weight=trending.COMMENT_WEIGHT)
+
+
+@shared_task(acks_late=True)
+def on_poll_saved(poll_pk: int):
+    search.index_poll(poll_pk)
 
-    try:
-        comment_dislike = CommentDislike.objects.get(author=user, comment=comment)
-        comment_dislike.delete()
-        comment.dislikes_count -= 1
-        comment.save()
-    except CommentDislike.DoesNotExist:
 
-        with suppress(ObjectDoesNotExist):
-            CommentLike.objects.get(author=user, comment=comment).delete()
+@shared_task(acks_late=True)
+def on_polls_saved(poll_pks: List[int]):
+    for poll_pk in poll_pks:
+        search.index_poll(poll_pk)
 
-        CommentDislike.objects.create(author=user, comment=comment)
-        comment.dislikes_count += 1
-        comment.save()
+
+@shared_task(acks_late=True)
+def on_poll_deleted(poll_pk: int):
+    search.remove_poll(poll_pk)
+
+
+@shared_task(acks_late=True)
+def on_voters_rebuild(kind: str, poll_id: int):
+    membership.rebuild(kind, poll_id)
 
 
 @shared_task
-def on_comment(poll_pk: int, created: bool):
-    poll = Poll.objects.get(pk=poll_pk)
-    if created:
-        poll.comments_count += 1
-    else:
-        poll.comments_count -= 1
-    poll.save()
+def snapshot_tallies():
+    history.snapshot_active_polls()
+
+
+@shared_task
+def prune_tally_snapshots():
+    history.prune()
@@ -0,0 +1,268 @@
+import json
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from polls import exports, history, membership
+from polls.ballots import retract_ranked_ballot, retract_simple_ballot
+from polls.models import Category, Comment, Option, Poll, PollCategory, RankedVote, SimpleVote
+from polls.serializers import (CommentWriteSerializer, PollBatchSerializer, PollSerializer,
+                               RankedVoteWriteSerializer, SimpleVoteSerializer)
+from polls.tasks import on_tallies_changed
+from polls.views import PollViewSet
+from users.models import User
+
+
+class PollProjectionParityTests(TestCase):
+    """project_polls must render the same JSON as PollSerializer for the list and retrieve actions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com', first_name='Ann')
+        cls.voter = User.objects.create(username='voter', email='voter@example.com', last_name='Voss')
+        categories = [Category.objects.create(name=name) for name in ('science', 'sport', 'music')]
+
+        cls.illustrated = Poll.objects.create(
+            author=cls.author, title='Illustrated', description='With an image',
+            end_datetime=datetime(2030, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc), is_confirmed=True,
+        )
+        for category in categories:
+            PollCategory.objects.create(poll=cls.illustrated, category=category)
+        first = Option.objects.create(
+            poll=cls.illustrated, option='First', image='options/first.png', simple_votes=1,
+            ranked_points=2, preferential_votes={'1': 1},
+        )
+        second = Option.objects.create(poll=cls.illustrated, option='Second', ranked_points=1, preferential_votes={})
+        SimpleVote.objects.create(poll=cls.illustrated, author=cls.voter, option=first)
+        for option, points in ((first, 2), (second, 1)):
+            RankedVote.objects.create(
+                poll=cls.illustrated, author=cls.voter, option=option, points=points, is_preferential=False
+            )
+
+        cls.empty = Poll.objects.create(author=cls.voter, title='No options')
+        PollCategory.objects.create(poll=cls.empty, category=categories[1])
+
+        cls.preferential = Poll.objects.create(author=cls.author, title='Preferential', description='')
+        option = Option.objects.create(poll=cls.preferential, option='Only', preferential_votes={'1': 1, '2': 3})
+        RankedVote.objects.create(
+            poll=cls.preferential, author=cls.voter, option=option, points=1, is_preferential=True
+        )
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def expected(self, request, user, polls):
+        request.user = user
+        view = PollViewSet(request=request, format_kwarg=None, action='list')
+        queryset = view.get_queryset().filter(pk__in=[poll.pk for poll in polls]).order_by('pk')
+        return PollSerializer(queryset, many=True, context={'request': request}).data
+
+    def test_list(self):
+        for user in (self.voter, self.author):
+            with self.subTest(user=user.username):
+                request = APIRequestFactory().get('/api/v1/polls/')
+                force_authenticate(request, user=user)
+                response = PollViewSet.as_view({'get': 'list'})(request)
+                actual = sorted(response.data, key=lambda poll: poll['id'])
+
+                expected = self.expected(request, user, (self.illustrated, self.empty, self.preferential))
+                self.assertEqual(self.render(actual), self.render(expected))
+
+    def test_list_vote_state(self):
+        request = APIRequestFactory().get('/api/v1/polls/')
+        force_authenticate(request, user=self.voter)
+        polls = {poll['id']: poll for poll in PollViewSet.as_view({'get': 'list'})(request).data}
+
+        illustrated = polls[self.illustrated.pk]
+        self.assertEqual(
+            [illustrated['has_simple_vote'], illustrated['has_ranked_vote'], illustrated['has_preferential_vote']],
+            [True, True, False],
+        )
+        self.assertTrue(polls[self.preferential.pk]['has_preferential_vote'])
+        self.assertEqual(polls[self.empty.pk]['options'], [])
+
+    def test_retrieve(self):
+        for poll in (self.illustrated, self.empty, self.preferential):
+            with self.subTest(poll=poll.title):
+                request = APIRequestFactory().get(f'/api/v1/polls/{poll.pk}/')
+                force_authenticate(request, user=self.voter)
+                response = PollViewSet.as_view({'get': 'retrieve'})(request, pk=poll.pk)
+
+                expected = self.expected(request, self.voter, (poll,))[0]
+                self.assertEqual(self.render(response.data), self.render(expected))
+
+    def test_retrieve_missing_poll(self):
+        request = APIRequestFactory().get('/api/v1/polls/0/')
+        force_authenticate(request, user=self.voter)
+        self.assertEqual(PollViewSet.as_view({'get': 'retrieve'})(request, pk=0).status_code, 404)
+
+
+class CommentWriteSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author', email='author@example.com')
+        cls.poll = Poll.objects.create(author=author, title='Comments')
+        cls.top_level = Comment.objects.create(poll=cls.poll, author=author, content='Top level')
+        cls.other = Comment.objects.create(poll=cls.poll, author=author, content='Other')
+
+    def test_parent_is_read_only_on_update(self):
+        serializer = CommentWriteSerializer(
+            self.other, data={'parent': self.top_level.pk, 'content': 'Edited'}, partial=True,
+            context={'poll_id': self.poll.pk},
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+
+        self.other.refresh_from_db()
+        self.assertIsNone(self.other.parent_id)
+        self.assertEqual(self.other.content, 'Edited')
+
+    def test_parent_is_writable_on_create(self):
+        serializer = CommentWriteSerializer(
+            data={'parent': self.top_level.pk, 'content': 'Reply'}, context={'poll_id': self.poll.pk}
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['parent'], self.top_level)
+
+
+class PollCategoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='author@example.com')
+        cls.science, cls.sport = (Category.objects.create(name=name) for name in ('science', 'sport'))
+
+    def poll(self, title):
+        ids = [self.science.pk, self.sport.pk, self.science.pk]
+        return {'title': title, 'description': '', 'categories': ids, 'options': [{'option': 'Only'}]}
+
+    def assert_counted_once(self, polls):
+        for poll in polls:
+            self.assertEqual(
+                sorted(PollCategory.objects.filter(poll=poll).values_list('category_id', flat=True)),
+                [self.science.pk, self.sport.pk],
+            )
+        self.assertEqual(
+            list(Category.objects.order_by('pk').values_list('polls_count', flat=True)), [len(polls), len(polls)]
+        )
+
+    def test_duplicate_categories_are_saved_once(self):
+        serializer = PollSerializer(data=self.poll('Single'))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assert_counted_once([serializer.save(author=self.author)])
+
+    def test_duplicate_categories_in_a_batch_are_saved_once(self):
+        serializer = PollBatchSerializer(data={'polls': [self.poll('First'), self.poll('Second')]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assert_counted_once(serializer.save(author=self.author))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        voter = User.objects.create(username='voter', email='voter@example.com')
+        cls.poll = Poll.objects.create(author=voter, title='Exported')
+        option = Option.objects.create(poll=cls.poll, option='Only', preferential_votes={})
+        cls.vote = SimpleVote.objects.create(poll=cls.poll, author=voter, option=option)
+
+    def test_timestamps_match_the_api(self):
+        expected = PollSerializer().fields['created_at'].to_representation(self.vote.created_at)
+        self.assertTrue(expected.endswith('Z'))
+
+        csv_rows = list(exports.csv_lines(self.poll.pk, 'default'))
+        self.assertEqual(csv_rows[1].split(',')[2], expected)
+        ndjson_rows = [json.loads(line) for line in exports.ndjson_lines(self.poll.pk, 'default')]
+        self.assertEqual(ndjson_rows[0]['created_at'], expected)
+
+
+class VoteCounterTests(TestCase):
+    """Votes are counted in their own transaction, so a retraction right after one never underflows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.voter = User.objects.create(username='voter', email='voter@example.com')
+        cls.poll = Poll.objects.create(author=cls.voter, title='Counted')
+        cls.first = Option.objects.create(poll=cls.poll, option='First', preferential_votes={})
+        cls.second = Option.objects.create(poll=cls.poll, option='Second', preferential_votes={})
+
+    def tallies(self):
+        return list(Option.objects.filter(poll=self.poll).order_by('pk').values_list(
+            'simple_votes', 'ranked_points', 'preferential_votes'
+        ))
+
+    def test_simple_vote_then_retract(self):
+        context = {'poll': self.poll, 'author': self.voter}
+        serializer = SimpleVoteSerializer(data={'option': self.first.pk}, context=context)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save(author=self.voter, poll=self.poll)
+        self.assertEqual(self.tallies(), [(1, 0, {}), (0, 0, {})])
+
+        retract_simple_ballot(self.poll.pk, self.voter.pk)
+        self.assertEqual(self.tallies(), [(0, 0, {}), (0, 0, {})])
+
+    def test_ranked_votes_then_retract(self):
+        cases = ((False, [(0, 2, {}), (0, 1, {})]), (True, [(0, 0, {'2': 1}), (0, 0, {'1': 1})]))
+        for is_preferential, expected in cases:
+            with self.subTest(is_preferential=is_preferential):
+                serializer = RankedVoteWriteSerializer(
+                    data={
+                        'is_preferential': is_preferential,
+                        'votes': [{'option': self.first.pk, 'points': 2}, {'option': self.second.pk, 'points': 1}],
+                    },
+                    context={'poll': self.poll, 'author': self.voter},
+                )
+                self.assertTrue(serializer.is_valid(), serializer.errors)
+                serializer.save()
+                self.assertEqual(self.tallies(), expected)
+
+                retract_ranked_ballot(self.poll.pk, self.voter.pk, is_preferential)
+                self.assertEqual(self.tallies(), [(0, 0, {}), (0, 0, {})])
+
+    def test_revotes_and_retractions_mark_the_poll_changed(self):
+        context = {'poll': self.poll, 'author': self.voter}
+        serializer = SimpleVoteSerializer(data={'option': self.first.pk}, context=context)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        vote = serializer.save(author=self.voter, poll=self.poll)
+        serializer = SimpleVoteSerializer(vote, data={'option': self.second.pk}, context=context)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        with mock.patch('polls.serializers.enqueue') as enqueue, self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+        enqueue.assert_called_once_with(on_tallies_changed, poll_pk=self.poll.pk)
+
+        with mock.patch('polls.ballots.enqueue') as enqueue, self.captureOnCommitCallbacks(execute=True):
+            with mock.patch('polls.membership.remove_voter'):
+                retract_simple_ballot(self.poll.pk, self.voter.pk)
+        enqueue.assert_called_once_with(on_tallies_changed, poll_pk=self.poll.pk)
+
+
+class TallySnapshotPackTests(SimpleTestCase):
+    def test_round_trip(self):
+        options = [(3, 2, 5, {'1': 1, '2': 4}), (7, 0, -1, {'2': -2})]
+        self.assertEqual(history.unpack(history.pack(options)), {
+            'options': [3, 7],
+            'simple_votes': [2, 0],
+            'ranked_points': [5, -1],
+            'preferential_votes': [[1, 4], [0, -2]],
+        })
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class VoterMembershipScheduleTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('altvote.queues.enqueue')
+    def test_rebuilds_are_scheduled_once(self, enqueue):
+        for _ in range(3):
+            membership.schedule_rebuild(membership.SIMPLE, 1)
+        membership.schedule_rebuild(membership.RANKED, 1)
+        self.assertEqual(enqueue.call_count, 2)
+
+        # what rebuild does when it starts
+        cache.delete(membership.scheduled_key(membership.SIMPLE, 1))
+        membership.schedule_rebuild(membership.SIMPLE, 1)
+        self.assertEqual(enqueue.call_count, 3)
@@ -0,0 +1,128 @@
+"""
+Trending polls from exponentially decayed vote and comment velocity.
+
+Each event adds `weight * e^(rate * (t - generation_start))` to the poll's
+score in a sorted set, which is equivalent to decaying every score by
+`e^(-rate * dt)` continuously but costs one ZINCRBY. To keep exponents small,
+scores live in hourly generations: the first event or read of a generation
+folds the previous generation in with a single weighted ZUNIONSTORE. Events
+are also counted into per-minute buckets to report recent activity.
+
+Revotes and retractions change tallies without being new events: they are
+only noted in per-minute sets, so tally history still picks their polls up.
+"""
+import math
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+KEY_PREFIX = 'polls:trending'
+GENERATION_SECONDS = 60 * 60
+VOTE_WEIGHT = 1.0
+COMMENT_WEIGHT = 0.5
+
+
+def decay_rate():
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def scores_key(generation):
+    return f'{KEY_PREFIX}:scores:{generation}'
+
+
+def carried_key(generation):
+    return f'{KEY_PREFIX}:carried:{generation}'
+
+
+def minute_key(minute):
+    return f'{KEY_PREFIX}:minute:{minute}'
+
+
+def changed_key(minute):
+    return f'{KEY_PREFIX}:changed:{minute}'
+
+
+def carry_over(connection, generation):
+    """Folds the decayed scores of the previous generation into this one and trims the set."""
+    key, previous_key = scores_key(generation), scores_key(generation - 1)
+    decay = math.exp(-decay_rate() * GENERATION_SECONDS)
+    pipeline = connection.pipeline()
+    pipeline.zunionstore(key, {previous_key: decay, key: 1.0})
+    pipeline.zremrangebyrank(key, 0, -settings.TRENDING_MAX_POLLS - 1)
+    pipeline.expire(key, 2 * GENERATION_SECONDS)
+    pipeline.execute()
+
+
+def record_event(poll_id, weight=VOTE_WEIGHT, now=None):
+    now = time.time() if now is None else now
+    generation = int(now // GENERATION_SECONDS)
+    minute = int(now // 60)
+    key = scores_key(generation)
+
+    connection = get_redis_connection('default')
+    pipeline = connection.pipeline(transaction=False)
+    pipeline.zincrby(key, weight * math.exp(decay_rate() * (now - generation * GENERATION_SECONDS)), poll_id)
+    pipeline.expire(key, 2 * GENERATION_SECONDS)
+    pipeline.hincrby(minute_key(minute), poll_id, 1)
+    pipeline.expire(minute_key(minute), (settings.TRENDING_WINDOW_MINUTES + 1) * 60)
+    pipeline.set(carried_key(generation), 1, nx=True, ex=2 * GENERATION_SECONDS)
+    if pipeline.execute()[-1]:
+        carry_over(connection, generation)
+
+
+def record_change(poll_id, now=None):
+    """Notes that the poll's tallies changed this minute, without counting it as trending activity."""
+    now = time.time() if now is None else now
+    key = changed_key(int(now // 60))
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    pipeline.sadd(key, poll_id)
+    pipeline.expire(key, (settings.TRENDING_WINDOW_MINUTES + 1) * 60)
+    pipeline.execute()
+
+
+def top_polls(limit, now=None):
+    """
+    Returns `(poll_id, score, recent_events)` for the `limit` hottest polls.
+
+    score is the decayed event weight as of now; recent_events counts events
+    over the last TRENDING_WINDOW_MINUTES.
+    """
+    now = time.time() if now is None else now
+    generation = int(now // GENERATION_SECONDS)
+    minute = int(now // 60)
+
+    connection = get_redis_connection('default')
+    if connection.set(carried_key(generation), 1, nx=True, ex=2 * GENERATION_SECONDS):
+        carry_over(connection, generation)
+
+    top = connection.zrevrange(scores_key(generation), 0, limit - 1, withscores=True)
+    if not top:
+        return []
+    poll_ids = [int(poll_id) for poll_id, _ in top]
+
+    pipeline = connection.pipeline(transaction=False)
+    for offset in range(settings.TRENDING_WINDOW_MINUTES):
+        pipeline.hmget(minute_key(minute - offset), poll_ids)
+    recent_events = [0] * len(poll_ids)
+    for bucket in pipeline.execute():
+        for index, count in enumerate(bucket):
+            if count is not None:
+                recent_events[index] += int(count)
+
+    decay = math.exp(-decay_rate() * (now - generation * GENERATION_SECONDS))
+    return [
+        (poll_id, score * decay, events)
+        for poll_id, (_, score), events in zip(poll_ids, top, recent_events)
+    ]
+
+
+def active_poll_ids(minutes, now=None):
+    """Returns the ids of the polls with events or changes in the last `minutes` minutes, the current one included."""
+    now = time.time() if now is None else now
+    minute = int(now // 60)
+    pipeline = get_redis_connection('default').pipeline(transaction=False)
+    for offset in range(minutes):
+        pipeline.hkeys(minute_key(minute - offset))
+        pipeline.smembers(changed_key(minute - offset))
+    return sorted({int(poll_id) for poll_ids in pipeline.execute() for poll_id in poll_ids})
@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
 
-from polls.views import CategoryViewSet, CommentViewSet, PollViewSet, SimpleVoteViewSet, RankedVoteViewSet
+from polls.views import (ActivityView, CategoryViewSet, CommentViewSet, PollViewSet, SimpleVoteViewSet,
+                         RankedVoteViewSet)
 
 router_v1 = SimpleRouter()
 router_v1.register(r'categories', CategoryViewSet, 'category')
@@ -12,5 +13,6 @@ router_v1.register(r'polls/(?P<poll_pk>\d+)/comments', CommentViewSet, 'comment'
 
 
 urlpatterns = [
+    path('me/activity/', ActivityView.as_view(), name='activity'),
     path('', include(router_v1.urls))
 ]
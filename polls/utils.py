@@ -6,4 +6,4 @@ if TYPE_CHECKING:
 
 
 def poll_end_datetime_passed(poll: Poll) -> bool:
-    return timezone.now() > poll.end_datetime
+    return poll.end_datetime is not None and timezone.now() > poll.end_datetime
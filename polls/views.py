@@ -1,15 +1,41 @@
-from django.db.models import Prefetch
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, permissions, status
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
 
-from polls.mixins import ListCreateMixin
-from polls.models import Category, Comment, Poll, SimpleVote, PollCategory, RankedVote, CommentLike, CommentDislike
-from polls.serializers import (CategorySerializer, PollSerializer, SimpleVoteSerializer,
+from altvote.queues import enqueue
+from altvote.renderers import float_safe_renderers
+from polls import activity
+from polls.ballots import retract_ranked_ballot, retract_simple_ballot
+from polls.catalog import get_catalog
+from polls.exports import CONTENT_TYPES, stream_ballots
+from polls.demographics import BRACKETS, get_breakdown, represent
+from polls.history import default_step, series
+from polls.loaders import load_poll
+from polls.mixins import ListCreateMixin, PollLookupMixin
+from polls.models import (Category, Comment, Poll, SimpleVote, PollCategory, PollTallySnapshot, RankedVote,
+                          CommentLike, CommentDislike)
+from polls.pagination import RepliesPagination, SearchPagination
+from polls.projections import project_polls
+from polls.search import PollSearchResults
+from polls.serializers import (CategorySerializer, PollSerializer, PollBatchSerializer, SimpleVoteSerializer,
                                RankedVoteReadSerializer, RankedVoteWriteSerializer,
-                               CommentReadSerializer, CommentWriteSerializer)
-from polls.tasks import on_like, on_dislike, on_ranked_votes, on_comment, on_simple_vote
+                               CommentReadSerializer, CommentReplySerializer, CommentWriteSerializer,
+                               ActivityPageSerializer)
+from polls.tasks import on_like, on_dislike, on_comment, on_poll_saved, on_polls_saved
+from polls.trending import top_polls
+from users.authentication import LazyJWTAuthentication
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -17,6 +43,9 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (permissions.AllowAny,)
     serializer_class = CategorySerializer
 
+    def list(self, request, *args, **kwargs):
+        return Response(get_catalog())
+
 
 class PollViewSet(viewsets.ModelViewSet):
     queryset = Poll.objects.all().select_related('author').prefetch_related(
@@ -29,9 +58,188 @@ class PollViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = PollSerializer
 
+    def get_queryset(self):
+        """Annotates whether the current user has already voted in each poll."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return super().get_queryset().annotate(
+                has_simple_vote=Value(False),
+                has_ranked_vote=Value(False),
+                has_preferential_vote=Value(False),
+            )
+
+        ranked_votes = RankedVote.objects.filter(poll=OuterRef('pk'), author=user)
+        return super().get_queryset().annotate(
+            has_simple_vote=Exists(SimpleVote.objects.filter(poll=OuterRef('pk'), author=user)),
+            has_ranked_vote=Exists(ranked_votes.filter(is_preferential=False)),
+            has_preferential_vote=Exists(ranked_votes.filter(is_preferential=True)),
+        )
+
+    def list(self, request, *args, **kwargs):
+        """Serves the poll list from `.values()` rows instead of PollSerializer."""
+        if self.paginator is not None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(project_polls(queryset, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        polls = project_polls(queryset, request)
+        if not polls:
+            raise Http404
+        return Response(polls[0])
+
     def perform_create(self, serializer):
         author = self.request.user
-        serializer.save(author=author)
+        poll = serializer.save(author=author)
+        enqueue(on_poll_saved, poll_pk=poll.pk)
+
+    def perform_update(self, serializer):
+        poll = serializer.save()
+        enqueue(on_poll_saved, poll_pk=poll.pk)
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_path='batch',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def batch(self, request):
+        """Creates many Polls with their categories and options in one transaction."""
+        serializer = PollBatchSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        poll_pks = [poll.pk for poll in serializer.save(author=request.user)]
+        enqueue(on_polls_saved, poll_pks=poll_pks)
+
+        polls = project_polls(self.get_queryset().filter(pk__in=poll_pks).order_by('pk'), request)
+        return Response(polls, status=status.HTTP_201_CREATED)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='trending',
+        permission_classes=(permissions.IsAuthenticated,),
+        # trending_score is a float
+        renderer_classes=float_safe_renderers(),
+    )
+    def trending(self, request):
+        """Polls with the highest decayed vote and comment velocity, hottest first."""
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+
+        top = top_polls(limit)
+        polls = {
+            poll['id']: poll
+            for poll in project_polls(self.get_queryset().filter(pk__in=[poll_id for poll_id, *_ in top]), request)
+        }
+        return Response([
+            {**polls[poll_id], 'trending_score': score, 'recent_events': recent_events}
+            for poll_id, score, recent_events in top
+            if poll_id in polls
+        ])
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_path='search',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def search(self, request):
+        """Full-text search over poll titles, descriptions and options, best matches first."""
+        paginator = SearchPagination()
+        poll_ids = paginator.paginate_queryset(
+            PollSearchResults(request.query_params.get('q', '')), request, view=self
+        )
+        polls = {poll['id']: poll for poll in project_polls(self.get_queryset().filter(pk__in=poll_ids), request)}
+        return paginator.get_paginated_response([polls[pk] for pk in poll_ids if pk in polls])
+
+    @action(
+        detail=True,
+        methods=['GET'],
+        url_path='export',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def export(self, request, pk=None):
+        """Streams all ballots of the Poll as CSV or NDJSON (`?output=ndjson`), for its author and staff."""
+        poll = get_object_or_404(Poll.objects.only('id', 'author_id'), pk=pk)
+        if not (request.user.is_staff or poll.author_id == request.user.id):
+            raise PermissionDenied('Only the poll author can export its ballots.')
+
+        output = request.query_params.get('output', 'csv')
+        if output not in CONTENT_TYPES:
+            raise ValidationError({'output': f'Expected one of: {", ".join(CONTENT_TYPES)}.'})
+
+        response = StreamingHttpResponse(stream_ballots(poll.pk, output), content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="poll-{poll.pk}-ballots.{output}"'
+        return response
+
+    @action(
+        detail=True,
+        methods=['GET'],
+        url_path='history',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def history(self, request, pk=None):
+        """
+        Option tallies of the Poll over time, one point per `step` bucket with activity.
+
+        `since` and `until` are ISO 8601 datetimes (the last day by default);
+        `step` is minute, hour, day or a number of seconds, by default the
+        smallest that fits the range into HISTORY_MAX_POINTS buckets.
+        """
+        get_object_or_404(Poll.objects.only('id'), pk=pk)
+        bounds = {}
+        for name in ('since', 'until'):
+            value = request.query_params.get(name)
+            bounds[name] = parse_datetime(value) if value else None
+            if value and bounds[name] is None:
+                raise ValidationError({name: 'Expected an ISO 8601 datetime.'})
+            if bounds[name] is not None and timezone.is_naive(bounds[name]):
+                bounds[name] = timezone.make_aware(bounds[name])
+        until = bounds['until'] or timezone.now()
+        since = bounds['since'] or until - timedelta(days=1)
+        if since >= until:
+            raise ValidationError({'since': 'Must be before until.'})
+
+        step = request.query_params.get('step')
+        if step is None:
+            step = default_step(since, until)
+        else:
+            resolutions = {label.lower(): resolution for resolution, label in PollTallySnapshot.RESOLUTIONS}
+            step = resolutions.get(step, step)
+            try:
+                step = int(step)
+            except ValueError:
+                raise ValidationError({'step': f'Expected seconds or one of: {", ".join(resolutions)}.'})
+            if step < PollTallySnapshot.MINUTE:
+                raise ValidationError({'step': f'Must be at least {PollTallySnapshot.MINUTE} seconds.'})
+            if (until - since).total_seconds() / step > settings.HISTORY_MAX_POINTS:
+                raise ValidationError({'step': f'The range spans more than {settings.HISTORY_MAX_POINTS} steps.'})
+
+        resolution, points = series(pk, step, since, until)
+        return Response({'since': since, 'until': until, 'step': step, 'resolution': resolution, 'series': points})
+
+    @action(
+        detail=True,
+        methods=['GET'],
+        url_path='demographics',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def demographics(self, request, pk=None):
+        """Option tallies of the Poll per voter age bracket, as of `as_of` (final once the Poll has ended)."""
+        poll = load_poll(pk)
+        tallies, as_of, final = get_breakdown(poll)
+        return Response({
+            'brackets': BRACKETS,
+            'as_of': as_of,
+            'final': final,
+            'options': represent(poll, tallies),
+        })
 
     @action(
         detail=True,
@@ -40,14 +248,8 @@ class PollViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def destroy_simple_votes(self, request, pk=None):
-        """Deletes all User's Simple Votes for a given Poll."""
-        simple_votes = SimpleVote.objects.filter(
-            poll_id=pk, author=self.request.user
-        )
-        for simple_vote in simple_votes:
-            on_simple_vote.delay(option_pk=simple_vote.option.id, created=False)
-        simple_votes.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        """Deletes all User's Simple Votes for a given Poll and returns the updated option tallies."""
+        return Response(retract_simple_ballot(pk, request.user.id))
 
     @action(
         detail=True,
@@ -56,16 +258,8 @@ class PollViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def destroy_ranked_votes(self, request, pk=None):
-        """Deletes all User's Ranked Votes for a given Poll."""
-        ranked_votes = RankedVote.objects.filter(
-            poll_id=pk, author=self.request.user, is_preferential=False
-        )
-        if ranked_votes:
-            options_list = ranked_votes.values_list('option_id', 'points', flat=True)
-            options_dict = {option[0]: option[1] for option in options_list}
-            on_ranked_votes.delay(options_dict=options_dict, created=False, ranked=True)
-        ranked_votes.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        """Deletes all User's Ranked Votes for a given Poll and returns the updated option tallies."""
+        return Response(retract_ranked_ballot(pk, request.user.id, is_preferential=False))
 
     @action(
         detail=True,
@@ -74,33 +268,47 @@ class PollViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def destroy_preferential_votes(self, request, pk=None):
-        """Deletes all User's Preferential Votes for a given Poll."""
-        preferential_votes = RankedVote.objects.filter(
-            poll_id=pk, author=self.request.user, is_preferential=True
-        )
-        if preferential_votes:
-            options_list = preferential_votes.values_list('option_id', 'points', flat=True)
-            options_dict = {option[0]: option[1] for option in options_list}
-            on_ranked_votes.delay(options_dict=options_dict, created=False, ranked=False)
-        preferential_votes.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        """Deletes all User's Preferential Votes for a given Poll and returns the updated option tallies."""
+        return Response(retract_ranked_ballot(pk, request.user.id, is_preferential=True))
 
 
-class SimpleVoteViewSet(ListCreateMixin):
+class SimpleVoteViewSet(PollLookupMixin, ListCreateMixin):
     """Manages current user's Simple Votes."""
     serializer_class = SimpleVoteSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update(
+            {
+                'poll': self.get_poll(),
+                'author': self.request.user,
+            }
+        )
+        return context
+
     def get_queryset(self):
         return SimpleVote.objects.filter(poll_id=self.kwargs.get('poll_pk'), author=self.request.user)
 
     def perform_create(self, serializer):
-        poll = get_object_or_404(Poll, pk=self.kwargs.get('poll_pk'))
+        poll = serializer.context['poll']
         author = self.request.user
         serializer.save(author=author, poll=poll)
 
+    @action(detail=False, methods=['PUT', 'PATCH'], url_path='revote')
+    def revote(self, request, poll_pk=None):
+        """Moves the User's Simple Vote to another option of the Poll."""
+        with transaction.atomic():
+            vote = self.get_queryset().select_for_update().first()
+            if vote is None:
+                raise ValidationError({'error': 'You have not voted for this poll yet.'})
+            serializer = self.get_serializer(vote, data=request.data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(serializer.data)
+
 
-class RankedVoteViewSet(ListCreateMixin):
+class RankedVoteViewSet(PollLookupMixin, ListCreateMixin):
     """Manages current user's Ranked and Preferential Votes."""
     permission_classes = (permissions.IsAuthenticated,)
     # TODO: filter is_preferential
@@ -109,7 +317,7 @@ class RankedVoteViewSet(ListCreateMixin):
         context = super().get_serializer_context()
         context.update(
             {
-                'poll': Poll.objects.get(pk=self.kwargs['poll_pk']),
+                'poll': self.get_poll(),
                 'author': self.request.user,
             }
         )
@@ -123,6 +331,14 @@ class RankedVoteViewSet(ListCreateMixin):
     def get_queryset(self):
         return RankedVote.objects.filter(poll_id=self.kwargs.get('poll_pk'), author=self.request.user)
 
+    @action(detail=False, methods=['PUT', 'PATCH'], url_path='revote')
+    def revote(self, request, poll_pk=None):
+        """Replaces the User's Ranked or Preferential ballot in one transaction."""
+        serializer = self.get_serializer(self.get_queryset(), data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
 
 class CommentViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
@@ -130,6 +346,8 @@ class CommentViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action == 'list':
             return CommentReadSerializer
+        if self.action == 'replies':
+            return CommentReplySerializer
         return CommentWriteSerializer
 
     def get_serializer_context(self):
@@ -137,12 +355,8 @@ class CommentViewSet(viewsets.ModelViewSet):
         context.update({'poll_id': self.kwargs['poll_pk']})
         return context
 
-    def get_queryset(self):
-        return Comment.objects.filter(
-            poll_id=self.kwargs.get('poll_pk'),
-            parent__isnull=True
-        ).select_related('author').prefetch_related(
-            'replies',
+    def get_reactions(self):
+        return (
             Prefetch(
                 'likes',
                 queryset=CommentLike.objects.filter(author=self.request.user),
@@ -155,34 +369,85 @@ class CommentViewSet(viewsets.ModelViewSet):
             )
         )
 
+    def get_queryset(self):
+        replies = Comment.objects.select_related('author').prefetch_related(
+            *self.get_reactions()
+        ).order_by('created_at', 'id')
+        return Comment.objects.filter(
+            poll_id=self.kwargs.get('poll_pk'),
+            parent__isnull=True
+        ).select_related('author').prefetch_related(
+            Prefetch('replies', queryset=replies[:settings.COMMENT_INLINE_REPLIES], to_attr='first_replies'),
+            *self.get_reactions()
+        )
+
     def perform_create(self, serializer):
         poll_pk = self.kwargs.get('poll_pk')
         poll = get_object_or_404(Poll, pk=poll_pk)
-        on_comment.delay(poll_pk=poll_pk, created=True)
-        serializer.save(author=self.request.user, poll=poll)
+        enqueue(on_comment, poll_pk=poll_pk, created=True)
+        with transaction.atomic():
+            comment = serializer.save(author=self.request.user, poll=poll)
+            if comment.parent_id is not None:
+                Comment.objects.filter(pk=comment.parent_id).update(replies_count=F('replies_count') + 1)
 
     def perform_destroy(self, instance):
-        on_comment.delay(poll_pk=self.kwargs.get('poll_pk'), created=False)
+        # replies are deleted along with their top-level comment
+        enqueue(on_comment, poll_pk=self.kwargs.get('poll_pk'), created=False, count=1 + instance.replies_count)
         instance.delete()
 
     @action(
         detail=True,
         methods=['POST'],
         url_path='likes',
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        authentication_classes=(LazyJWTAuthentication,)
     )
     def likes(self, request, pk=None, poll_pk=None):
         get_object_or_404(Comment, pk=pk, poll_id=poll_pk)
-        on_like.delay(comment_pk=pk, user_pk=self.request.user.id)
+        enqueue(on_like, comment_pk=pk, user_pk=self.request.user.id)
         return Response(status=status.HTTP_201_CREATED)
 
     @action(
         detail=True,
         methods=['POST'],
         url_path='dislikes',
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        authentication_classes=(LazyJWTAuthentication,)
     )
     def dislikes(self, request, pk=None, poll_pk=None):
         get_object_or_404(Comment, pk=pk, poll_id=poll_pk)
-        on_dislike.delay(comment_pk=pk, user_pk=self.request.user.id)
+        enqueue(on_dislike, comment_pk=pk, user_pk=self.request.user.id)
         return Response(status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['GET'], url_path='replies', pagination_class=RepliesPagination)
+    def replies(self, request, pk=None, poll_pk=None):
+        """Pages through all replies of a top-level comment, oldest first."""
+        get_object_or_404(Comment, pk=pk, poll_id=poll_pk, parent__isnull=True)
+        replies = Comment.objects.filter(parent_id=pk).select_related('author').prefetch_related(
+            *self.get_reactions()
+        )
+        page = self.paginate_queryset(replies)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class ActivityView(APIView):
+    """The current User's Simple Votes, Ranked and Preferential ballots and Comments, newest first."""
+    permission_classes = (permissions.IsAuthenticated,)
+    # describes the response for the API schema; pages are rendered by activity.represent
+    serializer_class = ActivityPageSerializer
+    page_size = 20
+    max_page_size = 100
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            limit = self.page_size
+        try:
+            events, cursor = activity.activity_page(request.user, request.query_params.get('cursor'), limit)
+        except activity.InvalidCursor as exc:
+            raise ValidationError({'cursor': str(exc)})
+
+        next_url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor) if cursor else None
+        return Response({'next': next_url, 'results': [activity.represent(event) for event in events]})
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from users.models import User
+
+# the password hash never leaves the database; a cached user loads it on access
+CACHED_FIELDS = tuple(field.attname for field in User._meta.concrete_fields if field.attname != 'password')
+
+
+def user_cache_key(user_id):
+    return f'users:auth:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def revoke_token_enabled():
+    # CHECK_REVOKE_TOKEN only exists in newer simplejwt releases
+    return getattr(api_settings, 'CHECK_REVOKE_TOKEN', False)
+
+
+def get_token_version(user):
+    if not revoke_token_enabled():
+        return None
+    from rest_framework_simplejwt.utils import get_md5_hash_password
+    return get_md5_hash_password(user.password)
+
+
+def get_cached_user(user_id):
+    """
+    Returns `(user, token_version)` for the user, from the cache when possible.
+
+    The user is built with the password deferred, so saving it only writes the
+    cached fields. token_version is the fingerprint of the password that
+    simplejwt puts into tokens when CHECK_REVOKE_TOKEN is enabled.
+    """
+    key = user_cache_key(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        try:
+            user = User.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist:
+            return None, None
+        entry = {
+            'values': [getattr(user, attname) for attname in CACHED_FIELDS],
+            'token_version': get_token_version(user),
+        }
+        cache.set(key, entry, settings.AUTH_USER_CACHE_TIMEOUT)
+
+    user = User.from_db('default', CACHED_FIELDS, entry['values'])
+    return user, entry['token_version']
+
+
+def get_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves users through the cache instead of a query per request.
+
+    Entries live for AUTH_USER_CACHE_TIMEOUT seconds and are dropped whenever
+    the user is saved or deleted (see users.signals).
+    """
+
+    def get_user(self, validated_token):
+        user, token_version = get_cached_user(get_user_id(validated_token))
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        if revoke_token_enabled():
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != token_version:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code='password_changed'
+                )
+
+        return user
+
+
+class LazyUser(SimpleLazyObject):
+    """A user whose id is known up front and whose row is only loaded on other attribute access."""
+
+    def __init__(self, user_id, func):
+        self.__dict__['_user_id'] = user_id
+        super().__init__(func)
+
+    @property
+    def id(self):
+        return self.__dict__['_user_id']
+
+    pk = id
+    is_authenticated = True
+    is_anonymous = False
+
+    def __bool__(self):
+        return True
+
+
+class LazyJWTAuthentication(CachedJWTAuthentication):
+    """
+    For endpoints that only need `request.user.id`.
+
+    Like simplejwt's JWTStatelessUserAuthentication, the token alone
+    authenticates the request: inactive-user and revocation checks only run
+    if the user is actually loaded.
+    """
+
+    def get_user(self, validated_token):
+        user_id = get_user_id(validated_token)
+        return LazyUser(user_id, lambda: super(LazyJWTAuthentication, self).get_user(validated_token))
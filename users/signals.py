@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.authentication import invalidate_user
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def on_user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+    # a concurrent request may re-cache the old row before the transaction commits
+    transaction.on_commit(lambda: invalidate_user(instance.pk))